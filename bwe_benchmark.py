@@ -0,0 +1,235 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import bwe_discord_json_parser as parser
+
+# ----------------- BENCHMARK -----------------
+# Generates synthetic Discord exports in the three shapes detect_file_type recognises
+# (chat list, DM dict, search dict), times the parser's main entry points on them (and
+# rendering the same export from its message store, or from already loaded data) and
+# reports messages/sec, MB/sec and peak RSS. Results can be saved as a baseline and
+# later runs compared against it to catch performance regressions:
+#
+#   python bwe_benchmark.py --messages 200000 --save baseline.json
+#   python bwe_benchmark.py --messages 200000 --compare baseline.json
+#
+# Every measurement runs in a fresh process so that peak RSS belongs to that step alone.
+
+WORDS = ("the quick brown fox jumps over lazy dog discord export message channel hello "
+         "world python parser transcript search index attachment embed mention lol ok").split()
+# Word planted in some messages so searches have something to find.
+SEARCH_WORD = "needleword"
+# Discord epoch (2015-01-01) in milliseconds, for snowflake ids.
+DISCORD_EPOCH_MS = 1420070400000
+
+def make_user(i):
+    return {"id": str(100000000000000000 + i), "username": f"user{i}",
+            "global_name": f"User {i}" if i % 3 else None}
+
+def make_message(rng, n, ts_ms, authors, channel_id, options):
+    """Return one synthetic message; n is its sequence number, ts_ms its time (Unix ms)."""
+    author = authors[rng.randrange(len(authors))]
+    words = rng.choices(WORDS, k=rng.randint(3, 30))
+    if n % 97 == 0:
+        words.append(SEARCH_WORD)
+    iso = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(ts_ms // 1000)) + f".{ts_ms % 1000:03d}000+00:00"
+    msg = {
+        "id": str((ts_ms - DISCORD_EPOCH_MS) << 22 | n % 4096),
+        "type": 0,
+        "channel_id": channel_id,
+        "content": " ".join(words),
+        "timestamp": iso,
+        "edited_timestamp": iso if rng.random() < 0.05 else None,
+        "author": author,
+        "mentions": [],
+        "attachments": [],
+        "embeds": [],
+    }
+    if rng.random() < options.mentions:
+        msg["mentions"] = [authors[rng.randrange(len(authors))]]
+    if rng.random() < options.attachments:
+        msg["attachments"] = [{"id": str(n), "filename": f"image{n}.png",
+                               "url": f"https://cdn.discordapp.com/attachments/{channel_id}/{n}/image{n}.png"}]
+    if rng.random() < options.embeds:
+        msg["embeds"] = [{"type": "image", "url": f"https://example.com/{n}",
+                          "thumbnail": {"url": f"https://example.com/{n}.jpg"}}]
+    return msg
+
+def generate_messages(rng, count, authors, channel_id, options):
+    """Return count messages, newest first like Discord exports."""
+    start = 1700000000000
+    messages = [make_message(rng, n, start + n * 45000 + rng.randrange(1000), authors, channel_id, options)
+                for n in range(count)]
+    messages.reverse()
+    return messages
+
+def generate_exports(folder, options):
+    """Write chat.json, dm.json and search.json into folder. Returns {shape: (path, message count)}."""
+    rng = random.Random(options.seed)
+    authors = [make_user(i) for i in range(max(options.authors, 3))]
+    pair = authors[:2]
+    paths = {}
+    for shape in ("chat", "dm", "search"):
+        if shape == "chat":
+            data = generate_messages(rng, options.messages, authors, "900000000000000001", options)
+        elif shape == "dm":
+            messages = generate_messages(rng, options.messages, pair, "900000000000000002", options)
+            data = {"channels": [{"id": "900000000000000002", "type": 1, "recipients": pair}],
+                    "messages": [messages[i:i + 50] for i in range(0, len(messages), 50)]}
+        else:
+            messages = generate_messages(rng, options.messages, authors, "900000000000000003", options)
+            data = {"total_results": len(messages), "messages": [[msg] for msg in messages],
+                    "analytics_id": "benchmark"}
+        path = os.path.join(folder, f"{shape}.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        paths[shape] = (path, options.messages)
+    return paths
+
+def run_step(step, path, folder, repeat):
+    """
+    Run one benchmark step in this (fresh) process and return its best time and peak RSS.
+    Steps that work on loaded data are timed without the load.
+    """
+    times = []
+    if step == "render_message_store":
+        # The store is built once, untimed; only rendering from it is measured.
+        store_path = os.path.join(folder, "bench_store.db")
+        stats = parser.new_file_stats()
+        stats["store"] = parser.MessageStoreWriter(store_path)
+        parser.stream_json_file(path, os.path.join(folder, "store_out.html"), stats)
+        stats["store"].close(keep=True, source_hash=None)
+    for _ in range(repeat):
+        if step == "process_json_file":
+            start = time.perf_counter()
+            parser.process_json_file(path)
+        elif step == "stream_json_file":
+            out_path = os.path.join(folder, "stream_out.html")
+            start = time.perf_counter()
+            parser.stream_json_file(path, out_path)
+        elif step == "render_message_store":
+            out_path = os.path.join(folder, "store_out.html")
+            start = time.perf_counter()
+            parser.render_export(*parser.open_message_store(store_path), path, out_path)
+        elif step == "render_messages":
+            data = parser.load_json_file(path)
+            header, fragments = parser.transcript_fragments(data, parser.detect_file_type(data), path)
+            start = time.perf_counter()
+            for _ in fragments:
+                pass
+        elif step in ("extract_participants", "extract_channel_ids"):
+            data = parser.load_json_file(path)
+            file_type = parser.detect_file_type(data)
+            start = time.perf_counter()
+            getattr(parser, step)(data, file_type)
+        elif step == "search_output":
+            start = time.perf_counter()
+            parser.search_output(SEARCH_WORD, path)
+        elif step == "search_index":
+            start = time.perf_counter()
+            parser.search_index(SEARCH_WORD, path)
+        times.append(time.perf_counter() - start)
+    return {"seconds": min(times), "peak_rss_mb": parser.peak_rss_mb()}
+
+def folder_size(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files)
+
+FILE_STEPS = ("process_json_file", "stream_json_file", "render_message_store", "render_messages",
+              "extract_participants", "extract_channel_ids")
+SEARCH_STEPS = ("search_output", "search_index")
+
+def run_benchmarks(options):
+    """Generate the exports, run every step and return {"shape/step": metrics}."""
+    folder = tempfile.mkdtemp(prefix="bwe_benchmark_")
+    results = {}
+    try:
+        print(f"Generating Synthetic Exports ({options.messages} Messages Each) In {folder}...")
+        exports = generate_exports(folder, options)
+        output_folder = os.path.join(folder, "Output")
+        jobs = []
+        for shape, (path, count) in exports.items():
+            for step in FILE_STEPS:
+                jobs.append((f"{shape}/{step}", step, path, count))
+        # Convert once so the search steps have transcripts and an index to search.
+        converted = parser.convert_files([path for path, _ in exports.values()], output_folder)
+        total = sum(count for _, count in exports.values())
+        for step in SEARCH_STEPS:
+            jobs.append((f"output/{step}", step, output_folder, total))
+
+        for name, step, path, count in jobs:
+            with ProcessPoolExecutor(max_workers=1) as pool:
+                metrics = pool.submit(run_step, step, path, folder, options.repeat).result()
+            size_mb = folder_size(path) / (1024 * 1024)
+            metrics["messages_per_sec"] = count / metrics["seconds"] if metrics["seconds"] else 0.0
+            metrics["mb_per_sec"] = size_mb / metrics["seconds"] if metrics["seconds"] else 0.0
+            results[name] = metrics
+            rss = f"{metrics['peak_rss_mb']:.1f} MB" if metrics["peak_rss_mb"] is not None else "N/A"
+            print(f"{name:<36} {metrics['seconds']:>9.3f} s {metrics['messages_per_sec']:>12.0f} msg/s "
+                  f"{metrics['mb_per_sec']:>9.1f} MB/s  Peak RSS {rss}")
+        if not all(r["out_name"] for r in converted):
+            print("Warning: Not Every Synthetic Export Was Converted.")
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+    return results
+
+def compare(results, baseline, tolerance):
+    """Print regressions against baseline results and return how many were found."""
+    regressions = 0
+    for name, metrics in results.items():
+        old = baseline.get(name)
+        if not old:
+            continue
+        if metrics["messages_per_sec"] < old["messages_per_sec"] * (1 - tolerance):
+            regressions += 1
+            print(f"Regression: {name} Throughput {metrics['messages_per_sec']:.0f} msg/s "
+                  f"vs Baseline {old['messages_per_sec']:.0f} msg/s")
+        if (metrics["peak_rss_mb"] and old.get("peak_rss_mb")
+                and metrics["peak_rss_mb"] > old["peak_rss_mb"] * (1 + tolerance)):
+            regressions += 1
+            print(f"Regression: {name} Peak RSS {metrics['peak_rss_mb']:.1f} MB "
+                  f"vs Baseline {old['peak_rss_mb']:.1f} MB")
+    return regressions
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Benchmark the BwE Discord JSON Chat Parser on synthetic exports.")
+    arg_parser.add_argument("--messages", type=int, default=50000, help="messages per synthetic export")
+    arg_parser.add_argument("--authors", type=int, default=50, help="distinct authors in chat and search exports")
+    arg_parser.add_argument("--attachments", type=float, default=0.1, help="fraction of messages with an attachment")
+    arg_parser.add_argument("--embeds", type=float, default=0.05, help="fraction of messages with an embed")
+    arg_parser.add_argument("--mentions", type=float, default=0.1, help="fraction of messages with a mention")
+    arg_parser.add_argument("--repeat", type=int, default=3, help="runs per step; the fastest is reported")
+    arg_parser.add_argument("--seed", type=int, default=1)
+    arg_parser.add_argument("--save", metavar="FILE", help="save the results as a baseline")
+    arg_parser.add_argument("--compare", metavar="FILE", help="compare against a saved baseline")
+    arg_parser.add_argument("--tolerance", type=float, default=0.15,
+                            help="allowed slowdown or memory growth before a regression is reported")
+    options = arg_parser.parse_args()
+
+    results = run_benchmarks(options)
+    run = {"options": vars(options), "python": sys.version.split()[0], "results": results}
+    if options.save:
+        with open(options.save, "w", encoding="utf-8") as f:
+            json.dump(run, f, indent=1)
+        print(f"\nBaseline Written To {options.save}")
+    if options.compare:
+        with open(options.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("options", {}).get("messages") != options.messages:
+            print("Warning: Baseline Was Recorded With A Different Message Count.")
+        regressions = compare(results, baseline.get("results", {}), options.tolerance)
+        if regressions:
+            print(f"\n{regressions} Regression(s) Found.")
+            sys.exit(1)
+        print("\nNo Regressions Found.")
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,50 @@
 import os
+import re
+import sys
+import glob
+import argparse
+import io
 import json
+import csv
 import shutil
 import ctypes
+import sqlite3
+import struct
+import hashlib
+import tempfile
+import gzip
+import bz2
+import lzma
+import zipfile
+import contextlib
+import heapq
+import time
+import cProfile
+import pstats
+import tracemalloc
+import select
+import signal
+import asyncio
+import urllib.request
+import urllib.error
+import http.client
+from urllib.parse import urlsplit
+from array import array
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from colorama import init, Fore, Style, Back
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache, partial
+
+try:
+    import zstandard
+except ImportError:  # Optional: only needed for .zst exports.
+    zstandard = None
+
+try:
+    import numpy
+except ImportError:  # Optional: analytics are aggregated with plain loops without it.
+    numpy = None
 
 # ----------------- SETTINGS -----------------
 # Adjust these options as desired:
@@ -20,11 +61,69 @@ from datetime import datetime
 # order_ascending:
 #   True = display from oldest to newest,
 #   False = display as-is (typically newest first)
+# stream_threshold_mb:
+#   JSON files of at least this many megabytes are parsed one message at a time
+#   instead of being loaded whole (0 = always stream).
+# workers:
+#   Number of processes converting files in parallel (1 = one at a time, 0 = one per CPU core).
+# build_search_index:
+#   True = index every message in Output/search_index.db for fast per-message search,
+#   False = searches scan the HTML files instead.
+# messages_per_page:
+#   0 = one HTML file per export, otherwise split transcripts into pages of this many
+#   messages (name_0001.html, ...) with an index page (name.html) listing their dates.
+# localize_media:
+#   True = download attachment and embed images into Output/media and point the
+#   transcripts' <img> tags at the local copies (links keep the original URLs),
+#   False = images load from the original URLs.
+# media_connections:
+#   Maximum number of media downloads running at once.
+# message_store:
+#   True = keep each export's messages in a compact SQLite store (Output/store) and
+#   render later conversions of the unchanged export from it, skipping JSON parsing,
+#   False = always parse the JSON.
+# filter_since / filter_until:
+#   Only keep messages from / up to this date or ISO time (UTC unless an offset is
+#   given; a date-only filter_until includes that whole day). None = no limit.
+# filter_authors / filter_channels:
+#   Only keep messages by these authors (IDs or usernames) / in these channel IDs.
+#   Empty = everyone / every channel.
+# filter_has_attachment / filter_has_embed:
+#   True = only keep messages with at least one attachment / embed.
+# profile:
+#   None = no profiling (run_report.json still records per-stage timings),
+#   "cprofile" = profile the run with cProfile into Output/profile (*.prof and a
+#   profile.txt summary), "tracemalloc" = trace Python memory allocations per file and
+#   add each file's peak and top allocation sites to run_report.json.
+# merge_channels:
+#   True = exports of the same channel (chat and DM files sharing a channel ID) become
+#   one transcript, with messages in several exports shown once (the latest edit),
+#   False = one transcript per export.
+# analytics:
+#   True = also write message analytics over all exports (analytics.json, analytics_*.csv
+#   and the analytics.html dashboard: activity per user, channel, day and hour, attachment
+#   and embed volumes, edit rates), False = no analytics.
 SETTINGS = {
     "display_mode": 1,
     "embed_images": False,
     "use_full_timestamp": False,
-    "order_ascending": True
+    "order_ascending": True,
+    "stream_threshold_mb": 64,
+    "workers": 1,
+    "build_search_index": True,
+    "messages_per_page": 0,
+    "localize_media": False,
+    "media_connections": 8,
+    "message_store": False,
+    "filter_since": None,
+    "filter_until": None,
+    "filter_authors": [],
+    "filter_channels": [],
+    "filter_has_attachment": False,
+    "filter_has_embed": False,
+    "profile": None,
+    "merge_channels": False,
+    "analytics": False
 }
 # --------------------------------------------
 
@@ -35,176 +134,326 @@ def sanitize_filename(name):
         name = name.replace(ch, "_")
     return name
 
+# Formatted timestamps are memoized, as many messages share the same second. The size
+# bounds the memory; least recently used entries are evicted first. User names are
+# cheaper to format than to look up, so they are not cached.
+TIMESTAMP_CACHE_SIZE = 65536
+# Escaped user names are memoized too, up to this many (see message_renderer).
+USER_CACHE_SIZE = 4096
+
 def format_user(author):
     """Return a string for a user based on SETTINGS['display_mode']."""
     if not author:
         return "Unknown"
     mode = SETTINGS.get("display_mode", 2)
     username = author.get("username", "Unknown")
-    global_name = author.get("global_name", "")
-    user_id = author.get("id", "")
-    if mode == 1:
-        return username
-    elif mode == 2:
+    if mode == 2:
+        global_name = author.get("global_name", "")
         return f"{username}/{global_name}" if global_name else username
     elif mode == 3:
+        global_name = author.get("global_name", "")
+        user_id = author.get("id", "")
         return f"{username}/{global_name}/{user_id}" if global_name else f"{username}/{user_id}"
     else:
         return username
 
+# What may follow the seconds of a Discord ISO timestamp for the cached path:
+# milli- or microseconds and a UTC offset, which the formatted output drops.
+_TIMESTAMP_SUFFIX = re.compile(r"(?:\.\d{3}|\.\d{6})?(?:[+-]\d\d:\d\d)?")
+
 def format_timestamp(ts):
     """Convert an ISO timestamp string to a formatted date/time string."""
+    try:
+        if _cacheable_suffix(ts[19:]):
+            return _format_timestamp_seconds(ts[:19])
+    except (TypeError, ValueError):
+        pass
     try:
         dt = datetime.fromisoformat(ts)
         return dt.strftime("%Y-%m-%d %H:%M:%S")
     except Exception:
         return ts
 
-def format_message(msg):
-    """Format a single message into an HTML snippet."""
-    ts_raw = msg.get("timestamp", "")
-    ts = ts_raw if SETTINGS.get("use_full_timestamp") else format_timestamp(ts_raw)
-    # Check for edited time.
-    edited_raw = msg.get("edited_timestamp")
-    edited_str = ""
-    if edited_raw:
-        edited_str = edited_raw if SETTINGS.get("use_full_timestamp") else format_timestamp(edited_raw)
-        edited_str = f" (edited: {edited_str})"
-    sender = format_user(msg.get("author"))
-    content = msg.get("content", "")
-    # Process mentions using the same display mode.
-    mentions = msg.get("mentions", [])
-    mention_str = ""
-    if mentions:
-        mention_names = ", ".join([format_user(m) for m in mentions])
-        mention_str = f"<br><em>Mentions:</em> {mention_names}"
-    # Process attachments.
-    attachments = msg.get("attachments", [])
-    att_str = ""
-    if attachments:
-        att_str = "<br><em>Attachments:</em> " + "<br>".join([
-            (
-                f'<img src="{att.get("url", "#")}" alt="{att.get("filename", "attachment")}" style="max-width:500px;"><br>'
-                f'<a href="{att.get("url", "#")}">{att.get("filename", "attachment")}</a>'
-                if not SETTINGS.get("embed_images") else
-                f'<a href="{att.get("url", "#")}">{att.get("filename", "attachment")}</a>'
-            )
-            for att in attachments
-        ])
+@lru_cache(maxsize=TIMESTAMP_CACHE_SIZE)
+def _cacheable_suffix(suffix):
+    # Exports use a handful of suffix shapes (mostly one per millisecond), and a cached
+    # answer is several times faster than matching the regex on every timestamp.
+    return _TIMESTAMP_SUFFIX.fullmatch(suffix) is not None
+
+@lru_cache(maxsize=TIMESTAMP_CACHE_SIZE)
+def _format_timestamp_seconds(ts):
+    # ts is cut to whole seconds, the part the formatted output depends on. Being naive,
+    # it formats like strftime("%Y-%m-%d %H:%M:%S"), only several times faster.
+    return datetime.fromisoformat(ts).isoformat(" ", "seconds")
+
+def formatting_cache_counts():
+    """Return {"timestamps": [hits, misses]} for the formatting caches."""
+    timestamps = _format_timestamp_seconds.cache_info()
+    return {"timestamps": [timestamps.hits, timestamps.misses]}
+
+# HTML special characters, replaced in one str.translate pass. Attributes are always
+# written double-quoted, so apostrophes can stay as they are. Most text needs no
+# escaping at all, which the substring checks find out much faster than translate.
+_HTML_ESCAPES = str.maketrans({"&": "&amp;", "<": "&lt;", ">": "&gt;", '"': "&quot;"})
+
+def escape_html(value):
+    """Return value (converted with str) escaped for HTML text or a double-quoted attribute."""
+    text = value if isinstance(value, str) else str(value)
+    if "&" in text or "<" in text or ">" in text or '"' in text:
+        return text.translate(_HTML_ESCAPES)
+    return text
+
+def format_timestamp_html(ts):
+    """format_timestamp for HTML output."""
+    text = format_timestamp(ts)
+    # Only a timestamp that could not be parsed comes back as is; formatted ones are
+    # digits and separators.
+    return escape_html(text) if text is ts else text
+
+def format_message(msg, sender=None):
+    """Format a single message into an HTML snippet. sender may be passed if already formatted."""
+    if sender is None:
+        sender = format_user(msg.get("author"))
+    return current_renderer()(msg, sender)
+
+def current_renderer():
+    """Return the message_renderer for the current SETTINGS."""
+    return message_renderer(SETTINGS.get("use_full_timestamp", False), SETTINGS.get("embed_images", False))
+
+@lru_cache(maxsize=None)
+def message_renderer(full_timestamp, link_attachments):
+    """
+    Return the function format_message uses for these use_full_timestamp and
+    embed_images SETTINGS: the choices that depend on them are made once here rather
+    than for every message. Everything taken from the message is escaped.
+    """
+    # Escaped user names, looked up before escaping them; a channel has few distinct authors.
+    names = {}
+
+    def escape_name(user):
+        name = escape_html(user)
+        if len(names) < USER_CACHE_SIZE:
+            names[user] = name
+        return name
+
+    def render_attachments(attachments):
+        items = []
+        for att in attachments:
+            # escape_html, inlined for the common case of nothing to escape.
+            url = att.get("url", "#")
+            if url.__class__ is not str or "&" in url or "<" in url or ">" in url or '"' in url:
+                url = escape_html(url)
+            name = att.get("filename", "attachment")
+            if name.__class__ is not str or "&" in name or "<" in name or ">" in name or '"' in name:
+                name = escape_html(name)
+            items.append(f'<a href="{url}">{name}</a>' if link_attachments else
+                         f'<img src="{url}" alt="{name}" style="max-width:500px;"><br><a href="{url}">{name}</a>')
+        return "<br><em>Attachments:</em> " + "<br>".join(items)
 
-    # Process embeds.
-    embeds = msg.get("embeds", [])
-    embed_str = ""
-    if embeds:
+    def render_embeds(embeds):
         embed_items = []
         for embed in embeds:
-            url = embed.get("url") or embed.get("thumbnail", {}).get("url") or embed.get("image", {}).get("url")
-            if embed.get("image") and embed["image"].get("url"):
-                img_url = embed["image"]["url"]
-                embed_items.append(
-                    f'<img src="{img_url}" alt="embed image" style="max-width:500px;"><br>'
-                    f'<a href="{img_url}">{img_url}</a>'
-                )
-            elif embed.get("thumbnail") and embed["thumbnail"].get("url"):
-                thumb_url = embed["thumbnail"]["url"]
-                embed_items.append(
-                    f'<img src="{thumb_url}" alt="embed thumbnail" style="max-width:500px;"><br>'
-                    f'<a href="{thumb_url}">{thumb_url}</a>'
-                )
-            elif embed.get("title") and embed.get("url"):
-                embed_items.append(
-                    f'<a href="{embed["url"]}">{embed["title"]}</a>'
-                )
-            elif url:
-                embed_items.append(
-                    f'<a href="{url}">{url}</a>'
-                )
-        if embed_items:
-            embed_str = "<br><em>Embeds:</em> " + "<br>".join(embed_items)
-
-
-    html = (
-        f'<div class="message"><span class="timestamp">[{ts}]{edited_str}</span> '
-        f'<strong>{sender}</strong>: {content}{mention_str}{att_str}{embed_str}</div><hr>\n'
-    )
-    return html
+            image = embed.get("image")
+            thumbnail = embed.get("thumbnail")
+            if image and image.get("url"):
+                url = image["url"]
+                kind = "image"
+            elif thumbnail and thumbnail.get("url"):
+                url = thumbnail["url"]
+                kind = "thumbnail"
+            else:
+                url = embed.get("url")
+                if not url:
+                    continue
+                kind = None
+            # escape_html, inlined as for attachments.
+            if url.__class__ is not str or "&" in url or "<" in url or ">" in url or '"' in url:
+                url = escape_html(url)
+            if kind:
+                embed_items.append(f'<img src="{url}" alt="embed {kind}" style="max-width:500px;"><br><a href="{url}">{url}</a>')
+            else:
+                title = embed.get("title")
+                embed_items.append(f'<a href="{url}">{escape_html(title) if title else url}</a>')
+        return "<br><em>Embeds:</em> " + "<br>".join(embed_items) if embed_items else ""
+
+    def render(msg, sender):
+        get = msg.get
+        ts = get("timestamp", "")
+        edited = get("edited_timestamp")
+        if full_timestamp:
+            ts = escape_html(ts)
+            edited_str = f" (edited: {escape_html(edited)})" if edited else ""
+        else:
+            # The cached path of format_timestamp, inlined; its output needs no escaping.
+            try:
+                ts = _format_timestamp_seconds(ts[:19]) if _cacheable_suffix(ts[19:]) else format_timestamp_html(ts)
+            except (TypeError, ValueError):
+                ts = format_timestamp_html(ts)
+            edited_str = f" (edited: {format_timestamp_html(edited)})" if edited else ""
+        # escape_html, inlined for the one field that is nearly always there.
+        content = get("content", "")
+        if content.__class__ is not str:
+            content = str(content)
+        if "&" in content or "<" in content or ">" in content or '"' in content:
+            content = content.translate(_HTML_ESCAPES)
+        name = names.get(sender) or escape_name(sender)
+        # Mentions use the same display mode as authors.
+        mention_str = ""
+        mentions = get("mentions")
+        if mentions:
+            mention_names = []
+            for user in mentions:
+                user = format_user(user)
+                mention_names.append(names.get(user) or escape_name(user))
+            mention_str = "<br><em>Mentions:</em> " + ", ".join(mention_names)
+        attachments = get("attachments")
+        att_str = render_attachments(attachments) if attachments else ""
+        embeds = get("embeds")
+        embed_str = render_embeds(embeds) if embeds else ""
+        return (
+            f'<div class="message"><span class="timestamp">[{ts}]{edited_str}</span> '
+            f'<strong>{name}</strong>: {content}{mention_str}{att_str}{embed_str}</div><hr>\n'
+        )
+
+    return render
+
+def new_file_stats():
+    """
+    Return an empty per-file statistics dict, filled in by the process_* functions.
+    An "index" entry holding a SearchIndexWriter may be added to also collect search rows,
+    a "media" set to collect image URLs (see media_urls), a "store" entry holding a
+    MessageStoreWriter to record the messages (render_export only), an "analytics" entry
+    holding an AnalyticsWriter to collect analytics columns and a "timings" dict to
+    collect seconds per stage (see timed).
+    """
+    return {"channel_ids": set(), "participants": set(), "messages": 0}
+
+def render_message(msg, stats=None, render=None):
+    """
+    Format a message and, if stats is given, record its channel ID and author there.
+    This lets one rendering pass replace separate extract_* walks over the data, and
+    counts the rendered messages. Loops pass render (see current_renderer) to look it
+    up once rather than per message.
+    """
+    sender = format_user(msg.get("author"))
+    if stats is not None:
+        stats["messages"] += 1
+        stats["participants"].add(sender)
+        if "channel_id" in msg:
+            stats["channel_ids"].add(msg["channel_id"])
+        index = stats.get("index")
+        if index is not None:
+            index.add(msg, sender)
+        media = stats.get("media")
+        if media is not None:
+            media.update(media_urls(msg))
+        analytics = stats.get("analytics")
+        if analytics is not None:
+            analytics.add(msg, sender)
+    if render is None:
+        render = current_renderer()
+    return render(msg, sender)
+
+def collect_channels(data, stats):
+    """Record channel IDs and recipients from the non-message parts of a DM/search dict."""
+    for channel in data.get("channels", []):
+        for rec in channel.get("recipients", []):
+            stats["participants"].add(format_user(rec))
+        if "id" in channel:
+            stats["channel_ids"].add(channel["id"])
+    for rec in data.get("recipients", []):
+        stats["participants"].add(format_user(rec))
 
-def process_normal_chat(data):
-    """Process a chat export (a list of messages)."""
-    html = ""
+def process_normal_chat(data, stats=None):
+    """
+    Process a chat export (a list of messages), yielding HTML fragments.
+    Fills stats (see new_file_stats) if given, once the fragments are consumed.
+    """
     if data and isinstance(data, list) and isinstance(data[0], dict) and "channel_id" in data[0]:
         channel_id = data[0].get("channel_id", "N/A")
-        html += f"<p><strong>Channel ID:</strong> {channel_id}</p>\n"
-    html += "<h2>Chat Transcript</h2>\n"
-    messages = list(reversed(data)) if SETTINGS.get("order_ascending") else data
+        yield f"<p><strong>Channel ID:</strong> {escape_html(channel_id)}</p>\n"
+    yield "<h2>Chat Transcript</h2>\n"
+    messages = reversed(data) if SETTINGS.get("order_ascending") else data
+    render = current_renderer()
     for msg in messages:
-        html += format_message(msg)
-    return html
+        yield render_message(msg, stats, render)
+
+def first_group_channel_id(groups, order_asc):
+    """
+    Return the channel ID of the first message group (in display order) whose first
+    message carries one, or None. Walks the groups in place without copying them.
+    """
+    for group in (reversed(groups) if order_asc else groups):
+        if group and isinstance(group, list) and isinstance(group[0], dict) and "channel_id" in group[0]:
+            return group[0].get("channel_id", "N/A")
+    return None
 
-def process_dm(data):
+def process_dm(data, stats=None):
     """
-    Process a DM export.
+    Process a DM export, yielding HTML fragments.
     The DM export might be a dict (with 'channels' and 'messages')
     or it might be a list (classified as DM because it has exactly 2 participants).
+    Fills stats (see new_file_stats) if given, once the fragments are consumed.
     """
-    html = ""
     order_asc = SETTINGS.get("order_ascending", True)
+    render = current_renderer()
     if isinstance(data, dict):
-        messages = data.get("messages", [])
-        for group in (list(reversed(messages)) if order_asc else messages):
-            if group and isinstance(group, list) and isinstance(group[0], dict) and "channel_id" in group[0]:
-                channel_id = group[0].get("channel_id", "N/A")
-                html += f"<p><strong>Channel ID:</strong> {channel_id}</p>\n"
-                break
-        html += "<h2>Direct Message Transcript</h2>\n"
-        for group in (list(reversed(messages)) if order_asc else messages):
-            if isinstance(group, list):
-                for msg in group:
-                    html += format_message(msg)
-        # Also check for recipients in the dict if "channels" is missing or empty.
+        # Show recipients from the dict if "channels" is missing or empty.
         if not data.get("channels"):
             recipients = data.get("recipients", [])
             if recipients:
-                rec_names = ", ".join([format_user(rec) for rec in recipients])
-                html = f"<p><strong>Recipients:</strong> {rec_names}</p>\n" + html
+                rec_names = ", ".join([escape_html(format_user(rec)) for rec in recipients])
+                yield f"<p><strong>Recipients:</strong> {rec_names}</p>\n"
+        messages = data.get("messages", [])
+        channel_id = first_group_channel_id(messages, order_asc)
+        if channel_id is not None:
+            yield f"<p><strong>Channel ID:</strong> {escape_html(channel_id)}</p>\n"
+        yield "<h2>Direct Message Transcript</h2>\n"
+        for group in (reversed(messages) if order_asc else messages):
+            if isinstance(group, list):
+                for msg in group:
+                    yield render_message(msg, stats, render)
+        if stats is not None:
+            collect_channels(data, stats)
     elif isinstance(data, list):
         if data and isinstance(data[0], dict) and "channel_id" in data[0]:
             channel_id = data[0].get("channel_id", "N/A")
-            html += f"<p><strong>Channel ID:</strong> {channel_id}</p>\n"
-        html += "<h2>Direct Message Transcript</h2>\n"
-        messages = list(reversed(data)) if order_asc else data
+            yield f"<p><strong>Channel ID:</strong> {escape_html(channel_id)}</p>\n"
+        yield "<h2>Direct Message Transcript</h2>\n"
+        messages = reversed(data) if order_asc else data
         for msg in messages:
-            html += format_message(msg)
-    return html
+            yield render_message(msg, stats, render)
 
-def process_search(data, filename):
-    """Process a search export (dict with 'total_results', 'channels', and 'messages').
-       The search term is taken as the original filename (without extension).
+def process_search(data, filename, stats=None):
+    """Process a search export (dict with 'total_results', 'channels', and 'messages'),
+       yielding HTML fragments. The search term is taken as the original filename
+       (without extensions). Fills stats (see new_file_stats) if given, once the
+       fragments are consumed.
     """
     total = data.get("total_results", "N/A")
-    base = os.path.splitext(os.path.basename(filename))[0]
-    search_term = base
-    html = f"<h2>Search Results - '{search_term}'</h2>\n"
-    html += f"<p><strong>Total Results:</strong> {total}</p>\n"
+    search_term = export_stem(filename)
+    yield f"<h2>Search Results - '{escape_html(search_term)}'</h2>\n"
+    yield f"<p><strong>Total Results:</strong> {escape_html(total)}</p>\n"
     messages = data.get("messages", [])
     order_asc = SETTINGS.get("order_ascending", True)
-    for group in (list(reversed(messages)) if order_asc else messages):
-        if group and isinstance(group, list) and isinstance(group[0], dict) and "channel_id" in group[0]:
-            channel_id = group[0].get("channel_id", "N/A")
-            html += f"<p><strong>Channel ID:</strong> {channel_id}</p>\n"
-            break
-    for group in (list(reversed(messages)) if order_asc else messages):
+    channel_id = first_group_channel_id(messages, order_asc)
+    if channel_id is not None:
+        yield f"<p><strong>Channel ID:</strong> {escape_html(channel_id)}</p>\n"
+    render = current_renderer()
+    for group in (reversed(messages) if order_asc else messages):
         if isinstance(group, list):
             for msg in group:
-                html += format_message(msg)
-    return html
+                yield render_message(msg, stats, render)
+    if stats is not None:
+        collect_channels(data, stats)
 
 def detect_file_type(data):
     """
     Detect file type based on JSON structure.
       - If data is a list and its first element is a dict with "timestamp" and "author", then:
            if there are exactly two distinct participants (by username), classify as "dm".
-           Otherwise, classify as "chat".
+           Otherwise, classify as "chat". The scan stops as soon as a third participant
+           is seen, so large group chats are decided from a short prefix.
       - If data is a dict and has "total_results" and "messages", return "search".
       - If data is a dict and has "channels" and "messages", return "dm".
       - Otherwise return "unknown".
@@ -215,6 +464,8 @@ def detect_file_type(data):
             for msg in data:
                 if isinstance(msg, dict) and "author" in msg:
                     participants.add(msg["author"].get("username", "Unknown"))
+                    if len(participants) > 2:
+                        return "chat"
             if len(participants) == 2:
                 return "dm"
             return "chat"
@@ -285,9 +536,13 @@ def extract_channel_ids(data, file_type):
                     channels.add(msg["channel_id"])
     return channels
 
-def generate_html_document(body_content, title):
-    """Wrap the body_content with basic HTML document structure."""
-    html = f"""<!DOCTYPE html>
+# Buffer size for transcript files, so many small fragment writes become few large ones.
+WRITE_BUFFER_SIZE = 1 << 20
+
+def html_document_head(title):
+    """Return the opening part of an HTML document, up to where the body content starts."""
+    title = escape_html(title)
+    return f"""<!DOCTYPE html>
 <html lang="en">
 <head>
     <meta charset="UTF-8">
@@ -301,41 +556,1053 @@ def generate_html_document(body_content, title):
 </head>
 <body>
 <h1>{title}</h1>
-{body_content}
+"""
+
+HTML_DOCUMENT_TAIL = """
 </body>
 </html>
 """
-    return html
 
-def process_json_file(filepath):
-    """Load a JSON file, detect its type, and return (file_type, HTML transcript, data)."""
+def generate_html_document(body_content, title):
+    """Wrap the body_content with basic HTML document structure."""
+    return html_document_head(title) + body_content + HTML_DOCUMENT_TAIL
+
+def write_html_document(out, fragments, title):
+    """Write an HTML document to the text file out, streaming the body fragments as they come."""
+    out.write(html_document_head(title))
+    for fragment in fragments:
+        out.write(fragment)
+    out.write(HTML_DOCUMENT_TAIL)
+
+# ----------------- INPUTS -----------------
+# Exports may be plain .json files, compressed single files (.json.gz, .json.xz,
+# .json.bz2, .json.zst) or members of a .zip archive, addressed as
+# "archive.zip::folder/export.json". Compressed data is decompressed as it is read,
+# straight into the JSON parser, so nothing is inflated to disk.
+
+ZIP_MEMBER_SEPARATOR = "::"
+COMPRESSED_SUFFIXES = (".gz", ".xz", ".bz2", ".zst")
+# JSON usually compresses about tenfold; used to guess the size of compressed exports
+# (for stream_threshold_mb) when the archive does not record it.
+COMPRESSION_RATIO_ESTIMATE = 10
+
+def split_source(filepath):
+    """Split an input path into (file path, zip member name or None)."""
+    path, sep, member = filepath.partition(ZIP_MEMBER_SEPARATOR)
+    return (path, member.replace("\\", "/")) if sep else (path, None)
+
+def compression_suffix(name):
+    """Return the compression suffix of name (".gz", ...), or "" if it is not compressed."""
+    lower = name.lower()
+    for suffix in COMPRESSED_SUFFIXES:
+        if lower.endswith(suffix):
+            return suffix
+    return ""
+
+def is_export_file(name):
+    """Return True if name looks like a (possibly compressed) JSON export the parser can read."""
+    lower = name.lower()
+    return lower[:len(lower) - len(compression_suffix(lower))].endswith('.json')
+
+def is_archive(name):
+    return name.lower().endswith('.zip') and ZIP_MEMBER_SEPARATOR not in name
+
+def export_stem(filename):
+    """Return the file name without its compression suffix and extension ("x.json.gz" -> "x")."""
+    filename = source_basename(filename)
+    return os.path.splitext(filename[:len(filename) - len(compression_suffix(filename))])[0]
+
+def archive_members(path):
+    """Return input paths for the export files inside a .zip archive, in archive order."""
+    try:
+        with zipfile.ZipFile(path) as archive:
+            return [f"{path}{ZIP_MEMBER_SEPARATOR}{info.filename}" for info in archive.infolist()
+                    if not info.is_dir() and is_export_file(info.filename)]
+    except (OSError, zipfile.BadZipFile) as e:
+        print(f"Error Reading {path}: {e}")
+        return []
+
+def decompressed(raw, name):
+    """Wrap the binary file raw in a streaming decompressor chosen by name's suffix."""
+    suffix = compression_suffix(name)
+    if suffix == ".gz":
+        return gzip.GzipFile(fileobj=raw, mode="rb")
+    if suffix == ".xz":
+        return lzma.LZMAFile(raw, "rb")
+    if suffix == ".bz2":
+        return bz2.BZ2File(raw, "rb")
+    if suffix == ".zst":
+        if zstandard is None:
+            raise RuntimeError("the zstandard package is needed to read .zst files (pip install zstandard)")
+        return zstandard.ZstdDecompressor().stream_reader(raw, closefd=True)
+    return raw
+
+@contextlib.contextmanager
+def open_export(filepath):
+    """Open an input (see split_source) as UTF-8 text, decompressing on the fly."""
+    path, member = split_source(filepath)
+    with contextlib.ExitStack() as stack:
+        if member is None:
+            raw = stack.enter_context(open(path, "rb"))
+        else:
+            archive = stack.enter_context(zipfile.ZipFile(path))
+            raw = stack.enter_context(archive.open(member))
+        raw = decompressed(raw, member or path)
+        yield stack.enter_context(io.TextIOWrapper(raw, encoding="utf-8"))
+
+def source_basename(filepath):
+    """Return the file name of an input, which for a zip member is the member's own name."""
+    path, member = split_source(filepath)
+    return os.path.basename(path) if member is None else member.rsplit("/", 1)[-1]
+
+def source_name(filepath):
+    """Return the normalised form of an input path, as used to key the manifest."""
+    path, member = split_source(filepath)
+    return os.path.normpath(path) + (ZIP_MEMBER_SEPARATOR + member if member is not None else "")
+
+def source_stat(filepath):
+    """
+    Return (size, mtime_ns, estimated uncompressed size) of an input. Zip members report
+    their uncompressed size and the archive's modification time.
+    """
+    path, member = split_source(filepath)
+    st = os.stat(path)
+    if member is not None:
+        with zipfile.ZipFile(path) as archive:
+            size = archive.getinfo(member).file_size
+        return size, st.st_mtime_ns, size
+    estimate = st.st_size * (COMPRESSION_RATIO_ESTIMATE if compression_suffix(path) else 1)
+    return st.st_size, st.st_mtime_ns, estimate
+
+# ----------------- FILTERS -----------------
+# The filter_* SETTINGS are applied to each message as it is read, before it is
+# formatted, indexed or spooled, so skipped messages cost little more than parsing.
+# Discord exports list messages newest first; while an export's snowflake IDs keep
+# that order (or the opposite one), reading stops as soon as a message falls past the
+# time range, since every later message would too.
+
+# Discord's epoch (2015-01-01) in milliseconds; snowflake IDs count from it.
+DISCORD_EPOCH_MS = 1420070400000
+FILTER_SETTINGS = ("filter_since", "filter_until", "filter_authors", "filter_channels",
+                   "filter_has_attachment", "filter_has_embed")
+# MessageFilter.check verdicts.
+KEEP, SKIP, STOP = "keep", "skip", "stop"
+
+def parse_filter_time(value, end=False):
+    """
+    Return a filter_since/filter_until value (date or ISO time) as a snowflake bound.
+    With end, a date-only value stands for the end of that day.
+    """
+    dt = datetime.fromisoformat(str(value))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    millis = (dt - _UNIX_EPOCH) // timedelta(milliseconds=1)
+    if end:
+        # Inclusive: the last snowflake of that millisecond, or of that day for a date.
+        millis += 86400000 if re.fullmatch(r"\d{4}-\d{2}-\d{2}", str(value)) else 1
+        return ((millis - DISCORD_EPOCH_MS) << 22) - 1
+    return (millis - DISCORD_EPOCH_MS) << 22
+
+def message_snowflake(msg):
+    """Return a message's snowflake ID as an int, derived from its timestamp if needed, or None."""
+    message_id = msg.get("id")
+    if isinstance(message_id, int) or (isinstance(message_id, str) and message_id.isdigit()):
+        return int(message_id)
+    micros = timestamp_micros(msg.get("timestamp"))
+    return None if micros is None else (micros // 1000 - DISCORD_EPOCH_MS) << 22
+
+class MessageFilter:
+    """The filter_* SETTINGS for one pass over an export's messages (see check)."""
+
+    def __init__(self, settings):
+        since, until = settings.get("filter_since"), settings.get("filter_until")
+        self.since = parse_filter_time(since) if since else None
+        self.until = parse_filter_time(until, end=True) if until else None
+        self.authors = self.id_set(settings.get("filter_authors"))
+        self.channels = self.id_set(settings.get("filter_channels"))
+        self.has_attachment = settings.get("filter_has_attachment", False)
+        self.has_embed = settings.get("filter_has_embed", False)
+        # Whether the snowflakes seen so far never went up / never went down.
+        self.descending = self.ascending = True
+        self.last = None
+        self.stopped = False
+
+    @staticmethod
+    def id_set(values):
+        """Return a filter list (or a single value) as a set of strings."""
+        if isinstance(values, (str, int)):
+            values = [values]
+        return {str(value) for value in values or ()}
+
+    @classmethod
+    def from_settings(cls):
+        """Return a MessageFilter for SETTINGS, or None if no filter is set."""
+        if not any(SETTINGS.get(key) for key in FILTER_SETTINGS):
+            return None
+        return cls(SETTINGS)
+
+    def check(self, msg):
+        """
+        Return KEEP or SKIP for msg, or STOP if it and every later message fall outside
+        the time range. Once STOP is returned it is returned for every later message.
+        """
+        if self.stopped:
+            return STOP
+        if self.since is not None or self.until is not None:
+            snowflake = message_snowflake(msg)
+            if snowflake is None:
+                return SKIP
+            if self.last is not None:
+                self.descending = self.descending and snowflake <= self.last
+                self.ascending = self.ascending and snowflake >= self.last
+            self.last = snowflake
+            if self.since is not None and snowflake < self.since:
+                self.stopped = self.descending and not self.ascending
+                return STOP if self.stopped else SKIP
+            if self.until is not None and snowflake > self.until:
+                self.stopped = self.ascending and not self.descending
+                return STOP if self.stopped else SKIP
+        if self.authors:
+            author = msg.get("author") or {}
+            if str(author.get("id")) not in self.authors and str(author.get("username")) not in self.authors:
+                return SKIP
+        if self.channels and str(msg.get("channel_id")) not in self.channels:
+            return SKIP
+        if self.has_attachment and not msg.get("attachments"):
+            return SKIP
+        if self.has_embed and not msg.get("embeds"):
+            return SKIP
+        return KEEP
+
+# ----------------- STREAMING -----------------
+# Large exports are read with a small incremental JSON reader so that only one
+# message (plus a read buffer) is held in memory at a time. Rendered messages are
+# spooled to a temporary file, because the document header (type, channel ID,
+# recipients) is only fully known once the whole export has been read.
+
+STREAM_CHUNK_SIZE = 1 << 16
+SPOOL_SEGMENT_BYTES = 1 << 20
+# Spool record header: byte lengths of a message's timestamp and HTML.
+_SPOOL_RECORD = struct.Struct("<II")
+_JSON_WHITESPACE = re.compile(r"[ \t\n\r]*")
+# Characters that may still extend a number decoded from the end of the buffer.
+_JSON_NUMBER_TAIL = re.compile(r"[0-9.eE+-]*\Z")
+
+class JsonStream:
+    """Incremental reader that decodes one JSON value at a time from a text file."""
+
+    def __init__(self, f, chunk_size=STREAM_CHUNK_SIZE):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self, size):
+        """Drop the consumed part of the buffer and read up to size more characters."""
+        data = self.f.read(size)
+        if not data:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + data
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Skip whitespace and return the next character without consuming it ("" at EOF)."""
+        while True:
+            self.pos = _JSON_WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill(self.chunk_size):
+                return ""
+
+    def expect(self, ch):
+        """Consume the character ch or raise ValueError."""
+        found = self.peek()
+        if found != ch:
+            raise ValueError(f"Expected {ch!r} But Found {found or 'EOF'!r} In JSON Stream")
+        self.pos += 1
+
+    def value(self):
+        """Decode and return the complete JSON value at the current position."""
+        self.peek()
+        size = self.chunk_size
+        while True:
+            try:
+                obj, end = self.decoder.raw_decode(self.buf, self.pos)
+                # A number cut off by the buffer end ("12." or "1e") decodes short of it, so
+                # only accept one once something that cannot continue it has been read.
+                if self.eof or not (isinstance(obj, (int, float)) and _JSON_NUMBER_TAIL.match(self.buf, end)):
+                    self.pos = end
+                    return obj
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self._fill(size)
+            # Grow the read size so a single huge value is not re-decoded quadratically.
+            size *= 2
+
+    def array_items(self):
+        """
+        Iterate over the array at the current position. Each iteration leaves the
+        stream positioned at the next element, which the caller must consume.
+        """
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield self
+            sep = self.peek()
+            self.pos += 1
+            if sep == "]":
+                return
+            if sep != ",":
+                raise ValueError(f"Expected ',' Or ']' But Found {sep or 'EOF'!r} In JSON Stream")
+
+def stream_export(stream):
+    """
+    Start reading a JSON export from a JsonStream.
+    Returns (shape, meta, events):
+      - shape is "list" for a top-level array, "dict" for a top-level object, else None.
+      - meta receives the top-level keys of a dict export as they are read; "messages"
+        is recorded with the value None since the messages themselves are streamed.
+      - events yields (group_index, message) pairs. group_index is None for list
+        exports, and the index within "messages" for dict exports.
+    """
+    meta = {}
+    first = stream.peek()
+    if first == "[":
+        def list_events():
+            for item in stream.array_items():
+                yield None, item.value()
+        return "list", meta, list_events()
+    if first == "{":
+        def dict_events():
+            stream.expect("{")
+            if stream.peek() == "}":
+                stream.pos += 1
+                return
+            while True:
+                key = stream.value()
+                stream.expect(":")
+                if key == "messages" and stream.peek() == "[":
+                    meta["messages"] = None
+                    for group_index, group in enumerate(stream.array_items()):
+                        if group.peek() == "[":
+                            for item in group.array_items():
+                                yield group_index, item.value()
+                        else:
+                            group.value()
+                else:
+                    meta[key] = stream.value()
+                sep = stream.peek()
+                stream.pos += 1
+                if sep == "}":
+                    return
+                if sep != ",":
+                    raise ValueError(f"Expected ',' Or '}}' But Found {sep or 'EOF'!r} In JSON Stream")
+        return "dict", meta, dict_events()
+    return None, meta, iter(())
+
+class MessageSpool:
+    """
+    Temporary file holding rendered messages, replayable in original or reversed order.
+    Messages are added in units (a single message, or a whole message group, see
+    end_unit); reversing reverses the units but keeps the messages inside a unit in
+    order. Units are buffered into segments of about SPOOL_SEGMENT_BYTES; in reverse
+    mode each segment is written with its units already reversed, so replaying backwards
+    only means reading the segments last to first. A unit too big for one segment is
+    written as it comes, over several segments that are replayed in order. Memory stays
+    at one segment plus its offset.
+    """
+
+    def __init__(self, directory=None, reverse=False):
+        self.f = tempfile.TemporaryFile(dir=directory)
+        self.reverse = reverse
+        self.offsets = array("q", [0])
+        # Whether each segment continues the unit of the segment before it.
+        self.continued = array("b")
+        self.pending = []
+        self.pending_size = 0
+        self.unit = []
+        self.unit_size = 0
+        self.spilled = False
+        self.count = 0
+
+    def add(self, timestamp, html):
+        """Append one message to the current unit."""
+        self.unit.append((timestamp, html))
+        self.unit_size += len(html)
+        self.count += 1
+        if self.unit_size >= SPOOL_SEGMENT_BYTES:
+            # Complete units go first, in a segment of their own.
+            if self.pending:
+                self._flush()
+            self.pending.append(self.unit)
+            self._flush(self.spilled)
+            self.unit = []
+            self.unit_size = 0
+            self.spilled = True
+
+    def end_unit(self):
+        """Mark the end of a unit (message or group) that reversing keeps in order."""
+        if self.spilled:
+            # The rest of a spilled unit follows its earlier segments.
+            if self.unit:
+                self.pending.append(self.unit)
+                self._flush(True)
+            self.spilled = False
+        elif self.unit:
+            self.pending.append(self.unit)
+            self.pending_size += self.unit_size
+            if self.pending_size >= SPOOL_SEGMENT_BYTES:
+                self._flush()
+        self.unit = []
+        self.unit_size = 0
+
+    def _flush(self, continued=False):
+        if self.reverse:
+            self.pending.reverse()
+        records = []
+        for unit in self.pending:
+            for timestamp, html in unit:
+                ts_data = timestamp.encode("utf-8")
+                html_data = html.encode("utf-8")
+                records.append(_SPOOL_RECORD.pack(len(ts_data), len(html_data)))
+                records.append(ts_data)
+                records.append(html_data)
+        data = b"".join(records)
+        self.f.write(data)
+        self.offsets.append(self.offsets[-1] + len(data))
+        self.continued.append(continued)
+        self.pending = []
+        self.pending_size = 0
+
+    def segments(self):
+        """Return the segment numbers in replay order."""
+        segments = range(len(self.continued))
+        if not self.reverse:
+            return segments
+        order = []
+        end = len(self.continued)
+        for i in reversed(segments):
+            # A spilled unit's segments stay in order.
+            if not self.continued[i]:
+                order.extend(range(i, end))
+                end = i
+        return order
+
+    def messages(self):
+        """Yield every (timestamp, html) pair in the spool's order."""
+        self.end_unit()
+        if self.pending:
+            self._flush()
+        for i in self.segments():
+            self.f.seek(self.offsets[i])
+            data = self.f.read(self.offsets[i + 1] - self.offsets[i])
+            pos = 0
+            while pos < len(data):
+                ts_len, html_len = _SPOOL_RECORD.unpack_from(data, pos)
+                pos += _SPOOL_RECORD.size
+                timestamp = data[pos:pos + ts_len].decode("utf-8")
+                pos += ts_len
+                yield timestamp, data[pos:pos + html_len].decode("utf-8")
+                pos += html_len
+
+    def write_to(self, out):
+        """Write every message's HTML to the text file out, in the spool's order."""
+        for _, html in self.messages():
+            out.write(html)
+
+    def close(self):
+        self.f.close()
+
+def loaded_export(data):
+    """Return (shape, meta, events) like stream_export does, for already loaded JSON data."""
+    if isinstance(data, list):
+        return "list", {}, ((None, msg) for msg in data)
+    if isinstance(data, dict):
+        meta = {key: value for key, value in data.items() if key != "messages"}
+        groups = []
+        if "messages" in data:
+            meta["messages"] = None
+            groups = data["messages"] if isinstance(data["messages"], list) else []
+        events = ((group_index, msg) for group_index, group in enumerate(groups)
+                  if isinstance(group, list) for msg in group)
+        return "dict", meta, events
+    return None, {}, iter(())
+
+def render_export(shape, meta, events, filepath, out_path, stats=None):
+    """
+    Render an export from its events (see stream_export) into out_path, or as pages if
+    SETTINGS["messages_per_page"] is set, and return the file type.
+    """
+    order_asc = SETTINGS.get("order_ascending", True)
+    if stats is None:
+        stats = new_file_stats()
+    index_writer = stats.get("index")
+    store_writer = stats.get("store")
+    message_filter = MessageFilter.from_settings()
+    render = current_renderer()
+    # A message store must hold the whole export, so reading only stops early without one.
+    # Dict exports are always read to the end (skipping their messages) since more
+    # top-level keys may follow "messages".
+    can_stop = store_writer is None
+    usernames = set()
+    header_channel = None
+    timings = stats.get("timings")
+    if timings is not None:
+        load_before = timings.get("load", 0.0)
+        events = timed_events(events, timings)
+    pass_start = time.perf_counter()
+    spool = MessageSpool(os.path.dirname(out_path) or None, reverse=order_asc)
+    try:
+        if shape == "list":
+            # An empty list never sees a message and so has no usernames either.
+            for index, (_, msg) in enumerate(events):
+                if index == 0:
+                    if not (isinstance(msg, dict) and "timestamp" in msg and "author" in msg):
+                        return "unknown"
+                    if "channel_id" in msg:
+                        header_channel = msg.get("channel_id", "N/A")
+                # As in detect_file_type, more than two usernames settles the type as chat.
+                if len(usernames) <= 2 and isinstance(msg, dict) and "author" in msg:
+                    usernames.add(msg["author"].get("username", "Unknown"))
+                if store_writer is not None:
+                    store_writer.add(None, msg)
+                if message_filter is not None:
+                    verdict = message_filter.check(msg)
+                    # Stop once the type is settled too (see below).
+                    if verdict == STOP and can_stop and len(usernames) > 2:
+                        break
+                    if verdict != KEEP:
+                        continue
+                spool.add(msg.get("timestamp", ""), render_message(msg, stats, render))
+                spool.end_unit()
+                if index_writer is not None:
+                    index_writer.end_unit()
+            if not usernames:
+                return "unknown"
+            file_type = "dm" if len(usernames) == 2 else "chat"
+        elif shape == "dict":
+            current_group = None
+            for group_index, msg in events:
+                if group_index != current_group:
+                    if current_group is not None:
+                        spool.end_unit()
+                        if index_writer is not None:
+                            index_writer.end_unit()
+                    current_group = group_index
+                    # The header uses the first qualifying group in display order.
+                    if isinstance(msg, dict) and "channel_id" in msg and (order_asc or header_channel is None):
+                        header_channel = msg.get("channel_id", "N/A")
+                if store_writer is not None:
+                    store_writer.add(group_index, msg)
+                if message_filter is not None and message_filter.check(msg) != KEEP:
+                    continue
+                spool.add(msg.get("timestamp", ""), render_message(msg, stats, render))
+            if "messages" in meta and "total_results" in meta:
+                file_type = "search"
+            elif "messages" in meta and "channels" in meta:
+                file_type = "dm"
+            else:
+                return "unknown"
+            collect_channels(meta, stats)
+        else:
+            return "unknown"
+        if store_writer is not None:
+            store_writer.finish(shape, meta)
+        if timings is not None:
+            # Detection and extraction happen in the same pass, so they count as rendering.
+            load = timings.get("load", 0.0) - load_before
+            add_timing(stats, "render", time.perf_counter() - pass_start - load)
+
+        name = source_basename(filepath)
+        body_head = ""
+        if file_type == "search":
+            title = f"Search Results Transcript ({name})"
+            body_head += f"<h2>Search Results - '{escape_html(export_stem(name))}'</h2>\n"
+            body_head += f"<p><strong>Total Results:</strong> {escape_html(meta.get('total_results', 'N/A'))}</p>\n"
+        elif file_type == "dm" and shape == "dict" and not meta.get("channels") and meta.get("recipients"):
+            rec_names = ", ".join([escape_html(format_user(rec)) for rec in meta["recipients"]])
+            body_head += f"<p><strong>Recipients:</strong> {rec_names}</p>\n"
+        if header_channel is not None:
+            body_head += f"<p><strong>Channel ID:</strong> {escape_html(header_channel)}</p>\n"
+        if file_type == "chat":
+            title = f"Chat Transcript ({name})"
+            body_head += "<h2>Chat Transcript</h2>\n"
+        elif file_type == "dm":
+            title = f"Direct Message Transcript ({name})"
+            body_head += "<h2>Direct Message Transcript</h2>\n"
+
+        with timed(stats, "write"):
+            if SETTINGS.get("messages_per_page", 0) > 0:
+                stats["pages"] = write_pages(spool, out_path, title, body_head)
+            else:
+                with open(out_path, "w", encoding="utf-8", buffering=WRITE_BUFFER_SIZE) as out:
+                    out.write(html_document_head(title))
+                    out.write(body_head)
+                    spool.write_to(out)
+                    out.write(HTML_DOCUMENT_TAIL)
+    finally:
+        spool.close()
+    return file_type
+
+def stream_json_file(filepath, out_path, stats=None):
+    """
+    Stream a JSON export one message at a time and write its HTML transcript to out_path.
+    Returns the file type and fills stats like write_json_file does (see render_export).
+    """
+    with open_export(filepath) as f:
+        shape, meta, events = stream_export(JsonStream(f))
+        return render_export(shape, meta, events, filepath, out_path, stats)
+
+# ----------------- PAGES -----------------
+# With SETTINGS["messages_per_page"] set, a transcript is split into pages named
+# <name>_0001.html, <name>_0002.html, ... next to an index page <name>.html that lists
+# each page's date range. Final names are only known after conversion (they are given
+# out in input order), so pages are written with blank space reserved for the
+# navigation links, which link_pages fills in place once the names are settled.
+
+# File names are at most 255 bytes, so three links fit unless escaping grows them
+# ('&', the one HTML special character sanitize_filename keeps); then only the index
+# link is kept (see link_pages).
+PAGE_NAV_BYTES = 1024
+
+def write_pages(spool, out_path, title, body_head):
+    """
+    Write the spooled messages as pages out_path_0001, out_path_0002, ... in one pass.
+    Returns a dict with the title, body_head and per-page info (first/last timestamp,
+    message count and the byte offsets of the reserved navigation blocks), which is
+    everything link_pages needs to name the pages and build the index page.
+    """
+    per_page = SETTINGS["messages_per_page"]
+    page_count = max(1, -(-spool.count // per_page))
+    tail = HTML_DOCUMENT_TAIL.encode("utf-8")
+    blank_nav = b" " * PAGE_NAV_BYTES
+    pages = []
+    out = None
+
+    def close_page():
+        page = pages[-1]
+        page["nav_offsets"].append(out.tell())
+        out.write(blank_nav)
+        out.write(tail)
+        out.close()
+
+    for timestamp, html in spool.messages():
+        if out is None or pages[-1]["count"] == per_page:
+            if out is not None:
+                close_page()
+            number = len(pages) + 1
+            out = open(f"{out_path}_{number:04d}", "wb", buffering=WRITE_BUFFER_SIZE)
+            out.write(html_document_head(f"{title} - Page {number}/{page_count}").encode("utf-8"))
+            pages.append({"first": timestamp, "last": timestamp, "count": 0, "nav_offsets": [out.tell()]})
+            out.write(blank_nav)
+        out.write(html.encode("utf-8"))
+        pages[-1]["last"] = timestamp
+        pages[-1]["count"] += 1
+    if out is None:
+        out = open(f"{out_path}_0001", "wb")
+        out.write(html_document_head(f"{title} - Page 1/1").encode("utf-8"))
+        pages.append({"first": "", "last": "", "count": 0, "nav_offsets": [out.tell()]})
+        out.write(blank_nav)
+    close_page()
+    return {"title": title, "body_head": body_head, "pages": pages}
+
+def page_names(out_name, page_count):
+    """Return the file names of the pages belonging to the index page out_name."""
+    stem = os.path.splitext(out_name)[0]
+    return [f"{stem}_{number:04d}.html" for number in range(1, page_count + 1)]
+
+def link_pages(output_folder, out_name, paging):
+    """
+    Fill in the navigation links of the pages named after out_name (see page_names) and
+    write the index page out_name, from the info returned by write_pages. Raises
+    ValueError if even the shortest navigation does not fit in PAGE_NAV_BYTES.
+    """
+    pages = paging["pages"]
+    names = page_names(out_name, len(pages))
+
+    def nav_block(links):
+        return f'<p class="pages">{" | ".join(links)}</p>\n'.encode("utf-8")
+
+    for number, (name, page) in enumerate(zip(names, pages), 1):
+        index_link = f'<a href="{escape_html(out_name)}">Index</a>'
+        position = f"Page {number}/{len(pages)}"
+        links = [index_link, position]
+        if number > 1:
+            links.insert(0, f'<a href="{escape_html(names[number - 2])}">&laquo; Previous</a>')
+        if number < len(pages):
+            links.append(f'<a href="{escape_html(names[number])}">Next &raquo;</a>')
+        nav = nav_block(links)
+        if len(nav) > PAGE_NAV_BYTES:
+            # The index page still links every page.
+            nav = nav_block([index_link, position])
+        if len(nav) > PAGE_NAV_BYTES:
+            raise ValueError(f"Page Links Of {out_name} Do Not Fit In {PAGE_NAV_BYTES} Bytes")
+        nav = nav.ljust(PAGE_NAV_BYTES)
+        with open(os.path.join(output_folder, name), "r+b") as f:
+            for offset in page["nav_offsets"]:
+                f.seek(offset)
+                f.write(nav)
+
+    with open(os.path.join(output_folder, out_name), "w", encoding="utf-8") as out:
+        out.write(html_document_head(paging["title"]))
+        out.write(paging["body_head"])
+        out.write("<h2>Pages</h2>\n<ul>\n")
+        for number, (name, page) in enumerate(zip(names, pages), 1):
+            dates = (f"{format_timestamp_html(page['first'])} - {format_timestamp_html(page['last'])}"
+                     if page["count"] else "Empty")
+            out.write(f'<li><a href="{escape_html(name)}">Page {number}</a>: {dates} ({page["count"]} Messages)</li>\n')
+        out.write("</ul>\n")
+        out.write(HTML_DOCUMENT_TAIL)
+
+def load_json_file(filepath):
+    """Load a whole JSON file, returning the data or None (after reporting) on error."""
     try:
-        with open(filepath, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        with open_export(filepath) as f:
+            return json.load(f)
     except Exception as e:
         print(f"Error Loading {filepath}: {e}")
-        return None, None, None
+        return None
 
-    file_type = detect_file_type(data)
-    transcript = ""
+def transcript_fragments(data, file_type, filepath, stats=None):
+    """Return (document title, HTML fragment generator) for loaded data of a known file type."""
+    name = source_basename(filepath)
     if file_type == "chat":
-        transcript = process_normal_chat(data)
-        header = f"Chat Transcript ({os.path.basename(filepath)})"
+        return f"Chat Transcript ({name})", process_normal_chat(data, stats)
     elif file_type == "dm":
-        transcript = process_dm(data)
-        header = f"Direct Message Transcript ({os.path.basename(filepath)})"
+        return f"Direct Message Transcript ({name})", process_dm(data, stats)
     elif file_type == "search":
-        transcript = process_search(data, filepath)
-        header = f"Search Results Transcript ({os.path.basename(filepath)})"
-    else:
+        return f"Search Results Transcript ({name})", process_search(data, filepath, stats)
+    return None, None
+
+def process_json_file(filepath, stats=None):
+    """
+    Load a JSON file, detect its type, and return (file_type, HTML transcript, data).
+    If stats (see new_file_stats) is given, channel IDs and participants are collected
+    while rendering, so extract_channel_ids/extract_participants need not walk the data again.
+    """
+    data = load_json_file(filepath)
+    if data is None:
+        return None, None, None
+
+    file_type = detect_file_type(data)
+    header, fragments = transcript_fragments(data, file_type, filepath, stats)
+    if fragments is None:
         return file_type, None, None
 
-    full_html = generate_html_document(transcript, header)
+    full_html = generate_html_document("".join(fragments), header)
     return file_type, full_html, data
 
+def write_json_file(filepath, out_path, stats=None):
+    """
+    Load a JSON file, detect its type, and write its HTML transcript to out_path as it
+    is rendered, without building the document in memory. Returns (file type, or None
+    if the file could not be loaded; whether messages were rendered in file order).
+    Nothing is written for unknown files. Paged output (SETTINGS["messages_per_page"]),
+    filtered output and exports being recorded in a message store (stats["store"]) are
+    written by render_export, which renders in file order.
+    """
+    with timed(stats, "load"):
+        data = load_json_file(filepath)
+    if data is None:
+        return None, False
+    if (SETTINGS.get("messages_per_page", 0) > 0 or (stats is not None and "store" in stats)
+            or MessageFilter.from_settings() is not None):
+        shape, meta, events = loaded_export(data)
+        return render_export(shape, meta, events, filepath, out_path, stats), True
+
+    with timed(stats, "detect"):
+        file_type = detect_file_type(data)
+    # Messages are written as they are rendered, so this covers both.
+    with timed(stats, "render"):
+        header, fragments = transcript_fragments(data, file_type, filepath, stats)
+        if fragments is not None:
+            with open(out_path, "w", encoding="utf-8", buffering=WRITE_BUFFER_SIZE) as out:
+                write_html_document(out, fragments, header)
+    return file_type, False
+
+def output_base_name(file_type, participants, filename):
+    """Derive the (sanitized) output base name from the file type and its participants."""
+    if file_type in ("chat", "dm"):
+        if len(participants) == 0:
+            base_name = file_type
+        elif len(participants) == 1:
+            base_name = f"{file_type}_{participants[0]}"
+        elif len(participants) == 2:
+            base_name = f"{file_type}_{participants[0]}_{participants[1]}"
+        else:
+            base_name = f"{file_type}_multi"
+    elif file_type == "search":
+        base_name = f"search_{export_stem(filename)}"
+    else:
+        base_name = file_type
+    return sanitize_filename(base_name)
+
+def temp_name(filepath):
+    """Return the base name of an input's temporary files in the output folder."""
+    # Inputs from different folders may share a file name, so the path is hashed in too.
+    path_hash = hashlib.blake2b(os.path.abspath(filepath).encode("utf-8"), digest_size=4).hexdigest()
+    return f".{sanitize_filename(source_basename(filepath))}.{path_hash}"
+
+def message_store_path(output_folder, filepath):
+    """Return where the message store of an input lives (see MessageStoreWriter)."""
+    return os.path.join(output_folder, STORE_FOLDER, f"{temp_name(filepath)[1:]}.db")
+
+def uses_message_store():
+    # Merging reads every export from its store, so merge mode always keeps them.
+    return SETTINGS.get("message_store") or SETTINGS.get("merge_channels")
+
+def convert_file(filepath, output_folder):
+    """
+    Convert one JSON export into a temporary transcript inside output_folder and return
+    its result (see run_conversion). Runs in worker processes, so it must stay picklable.
+    """
+    size, mtime_ns, uncompressed_size = source_stat(filepath)
+    result = {"filename": source_basename(filepath), "source": source_name(filepath),
+              "size": size, "mtime_ns": mtime_ns, "hash": file_digest(filepath)}
+
+    def render(part_path, stats):
+        stored = None
+        if uses_message_store():
+            store_path = message_store_path(output_folder, filepath)
+            stored = open_message_store(store_path, result["hash"])
+            if stored is None:
+                stats["store"] = MessageStoreWriter(store_path)
+        # Large files are streamed straight into the temporary transcript.
+        threshold = SETTINGS.get("stream_threshold_mb", 64) * 1024 * 1024
+        streamed = uncompressed_size >= threshold
+        # render_export renders in file order and the spool reverses afterwards.
+        file_order = True
+        if stored is not None:
+            # Unchanged since its store was written: no JSON to parse.
+            try:
+                file_type = render_export(*stored, filepath, part_path, stats)
+            except (sqlite3.Error, ValueError) as e:
+                print(f"Error Reading The Message Store Of {filepath}: {e}")
+                file_type = None
+        elif streamed:
+            try:
+                file_type = stream_json_file(filepath, part_path, stats)
+            except Exception as e:
+                print(f"Error Loading {filepath}: {e}")
+                file_type = None
+        else:
+            file_type, file_order = write_json_file(filepath, part_path, stats)
+        store_writer = stats.pop("store", None)
+        if store_writer is not None:
+            with timed(stats, "store"):
+                store_writer.close(keep=file_type not in (None, "unknown"), source_hash=result["hash"])
+        return file_type, file_order
+
+    return run_conversion(result, temp_name(filepath), output_folder, render)
+
+def run_conversion(result, name, output_folder, render):
+    """
+    Render the temporary transcript output_folder/name.part with render(part_path, stats),
+    which returns (file type, whether in file order), and complete result from it.
+    """
+    start = time.perf_counter()
+    if SETTINGS.get("profile") == "tracemalloc":
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+    cache_before = formatting_cache_counts()
+    result.update({"file_type": None, "channel_ids": set(), "participants": [], "part_path": None,
+                   "index_path": None, "paging": None, "media": [], "analytics": None})
+    part_path = os.path.join(output_folder, f"{name}.part")
+    index_path = os.path.join(output_folder, f"{name}.idx.part")
+    stats = new_file_stats()
+    stats["timings"] = {}
+    if SETTINGS.get("build_search_index", True) and fts5_available():
+        stats["index"] = SearchIndexWriter(index_path)
+    if SETTINGS.get("localize_media"):
+        stats["media"] = set()
+    if SETTINGS.get("analytics"):
+        stats["analytics"] = AnalyticsWriter(os.path.join(output_folder, ANALYTICS_FOLDER, f"{name[1:]}.cols"))
+    file_type, file_order = render(part_path, stats)
+    result["file_type"] = file_type
+    result["cache_counts"] = {name: [after - before for after, before in zip(counts, cache_before[name])]
+                              for name, counts in formatting_cache_counts().items()}
+
+    index = stats.pop("index", None)
+    analytics = stats.pop("analytics", None)
+    if analytics is not None:
+        with timed(stats, "analytics"):
+            analytics.close(keep=file_type not in (None, "unknown"))
+        if file_type not in (None, "unknown"):
+            result["analytics"] = os.path.basename(analytics.path)
+    if file_type in (None, "unknown"):
+        if index is not None:
+            index.close()
+            os.remove(index_path)
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        result["report"] = file_report(result, stats, start, [])
+        return result
+    if index is not None:
+        with timed(stats, "index"):
+            index.close(reverse=file_order and SETTINGS.get("order_ascending", True))
+        result["index_path"] = index_path
+    participants = sorted(stats["participants"]) if file_type in ("chat", "dm") else []
+    result.update(channel_ids=stats["channel_ids"], participants=participants, part_path=part_path,
+                  paging=stats.get("pages"), media=sorted(stats.get("media", ())))
+    outputs = ([f"{part_path}_{number:04d}" for number in range(1, len(result["paging"]["pages"]) + 1)]
+               if result["paging"] else [part_path])
+    result["report"] = file_report(result, stats, start, outputs)
+    return result
+
+def init_worker(settings):
+    """Process pool initializer: apply the parent's SETTINGS in the worker."""
+    SETTINGS.update(settings)
+
+# ----------------- SEARCH INDEX -----------------
+# Every converted message is added to a SQLite FTS5 table in Output/search_index.db,
+# so searches are answered per message without re-reading the HTML transcripts.
+# Workers write each file's rows to a temporary database; the parent merges them
+# once the output file name is known.
+
+SEARCH_INDEX_NAME = "search_index.db"
+SEARCH_RESULT_LIMIT = 100
+
+_fts5_available = None
+
+def fts5_available():
+    """Return True if this Python's SQLite build supports FTS5."""
+    global _fts5_available
+    if _fts5_available is None:
+        try:
+            conn = sqlite3.connect(":memory:")
+            conn.execute("CREATE VIRTUAL TABLE t USING fts5(x)")
+            conn.close()
+            _fts5_available = True
+        except sqlite3.Error:
+            _fts5_available = False
+    return _fts5_available
+
+class SearchIndexWriter:
+    """Collects one export's messages for the search index in a temporary SQLite file."""
+
+    BATCH_SIZE = 1000
+
+    def __init__(self, path):
+        if os.path.exists(path):
+            os.remove(path)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            "CREATE TABLE rows (position INTEGER, unit INTEGER, message_id TEXT, "
+            "author TEXT, timestamp TEXT, content TEXT)"
+        )
+        self.rows = []
+        self.count = 0
+        self.unit = 0
+
+    def add(self, msg, sender):
+        """Record a message; position is its number in rendering order."""
+        self.rows.append((self.count, self.unit, str(msg.get("id", "")), sender,
+                          msg.get("timestamp", ""), str(msg.get("content") or "")))
+        self.count += 1
+        if len(self.rows) >= self.BATCH_SIZE:
+            self._flush()
+
+    def end_unit(self):
+        """Mark the end of a unit (message or group) that the output spool may reverse."""
+        self.unit += 1
+
+    def _flush(self):
+        self.conn.executemany("INSERT INTO rows VALUES (?, ?, ?, ?, ?, ?)", self.rows)
+        self.rows = []
+
+    def close(self, reverse=False):
+        """
+        Commit and close. With reverse=True, positions are remapped to the order in
+        which MessageSpool replays reversed units (messages inside a unit keep their order).
+        """
+        self._flush()
+        if reverse:
+            # Keyed by unit so the lookup below is not a scan per row.
+            self.conn.execute("CREATE TEMP TABLE units (unit INTEGER PRIMARY KEY, start INTEGER, size INTEGER)")
+            self.conn.execute("INSERT INTO units SELECT unit, MIN(position), COUNT(*) FROM rows GROUP BY unit")
+            self.conn.execute(
+                "UPDATE rows SET position = ? + position - "
+                "(SELECT 2 * start + size FROM units WHERE units.unit = rows.unit)",
+                (self.count,)
+            )
+        self.conn.commit()
+        self.conn.close()
+
+def open_search_index(output_folder):
+    """Open (creating if needed) the search index database in output_folder."""
+    conn = sqlite3.connect(os.path.join(output_folder, SEARCH_INDEX_NAME))
+    conn.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS messages USING fts5("
+        "content, author, file UNINDEXED, position UNINDEXED, message_id UNINDEXED, timestamp UNINDEXED)"
+    )
+    # Paged transcripts: messages are indexed under the index page, with their page found from per_page.
+    conn.execute("CREATE TABLE IF NOT EXISTS pages (file TEXT PRIMARY KEY, per_page INTEGER)")
+    return conn
+
+def merge_file_index(conn, index_path, out_name, per_page=None):
+    """
+    Copy one file's rows (written by SearchIndexWriter) into the search index, then delete
+    them. per_page is given for paged transcripts.
+    """
+    conn.execute("ATTACH DATABASE ? AS part", (index_path,))
+    try:
+        conn.execute(
+            "INSERT INTO messages (content, author, file, position, message_id, timestamp) "
+            "SELECT content, author, ?, position + 1, message_id, timestamp FROM part.rows",
+            (out_name,)
+        )
+        if per_page:
+            conn.execute("INSERT OR REPLACE INTO pages VALUES (?, ?)", (out_name, per_page))
+        conn.commit()
+    finally:
+        conn.execute("DETACH DATABASE part")
+    os.remove(index_path)
+
+def search_index(search_term, output_folder, limit=SEARCH_RESULT_LIMIT):
+    """
+    Search the message index in output_folder. Returns (total hits, list of up to limit
+    hit dicts with file, position, author, timestamp and snippet), or None if there is
+    no usable index, in which case search_output should be used instead.
+    """
+    path = os.path.join(output_folder, SEARCH_INDEX_NAME)
+    if not search_term or not os.path.exists(path) or not fts5_available():
+        return None
+    # Match the term as a phrase, with the last word as a prefix (like a substring search would).
+    query = '"' + search_term.replace('"', '""') + '"*'
+    conn = sqlite3.connect(path)
+    try:
+        total = conn.execute("SELECT COUNT(*) FROM messages WHERE messages MATCH ?", (query,)).fetchone()[0]
+        rows = conn.execute(
+            "SELECT messages.file, position, author, timestamp, snippet(messages, 0, '', '', '...', 12), per_page "
+            "FROM messages LEFT JOIN pages ON pages.file = messages.file "
+            "WHERE messages MATCH ? ORDER BY messages.file, position LIMIT ?",
+            (query, limit)
+        ).fetchall()
+    except sqlite3.Error:
+        return None
+    finally:
+        conn.close()
+    hits = []
+    for f, pos, author, ts, snip, per_page in rows:
+        if per_page:
+            # Point at the page holding the message rather than the index page.
+            f = page_names(f, (pos - 1) // per_page + 1)[-1]
+        hits.append({"file": f, "position": pos, "author": author, "timestamp": ts, "snippet": snip})
+    return total, hits
+
 def search_output(search_term, output_folder):
     """Search for the given term in all .html files in the output folder and return a list of matching files."""
     matching_files = []
+    # Text in the transcripts is escaped, so the term is compared in that form.
+    html_term = escape_html(search_term).lower()
     for root, dirs, files in os.walk(output_folder):
         for file in files:
             if file.lower().endswith('.html'):
@@ -343,129 +1610,1429 @@ def search_output(search_term, output_folder):
                 try:
                     with open(file_path, 'r', encoding='utf-8') as f:
                         content = f.read()
-                        if search_term.lower() in content.lower():
+                        if html_term in content.lower():
                             matching_files.append(file)
                 except Exception as e:
                     print(f"Error Reading {file_path}: {e}")
     return matching_files
-    
 
-    
-def main():
-    def set_window_title(title):
-        # Encode the title to ANSI
-        title_ansi = title.encode('ansi', 'ignore')
-        ctypes.windll.kernel32.SetConsoleTitleA(title_ansi)
+def print_search_results(search_term, output_folder):
+    """Search the output folder (using the index when there is one), print the hits and return True if any."""
+    indexed = search_index(search_term, output_folder)
+    if indexed is not None:
+        total, hits = indexed
+        if not total:
+            return False
+        print(f"\nSearch Term Found In {total} Message(s):")
+        for hit in hits:
+            print(f"- {hit['file']} #{hit['position']} [{format_timestamp(hit['timestamp'])}] "
+                  f"{hit['author']}: {hit['snippet']}")
+        if total > len(hits):
+            print(f"... And {total - len(hits)} More.")
+        return True
+    results = search_output(search_term, output_folder)
+    if results:
+        print("\nSearch Term Found In The Following File(s):")
+        for r in results:
+            print(f"- {r}")
+        return True
+    return False
 
-    set_window_title('BwE Discord Chat JSON Parser')
-    
-    version = "1.0.0"
+# ----------------- MESSAGE STORE -----------------
+# With SETTINGS["message_store"], each export's messages are also written, while it is
+# converted, to a compact SQLite table in Output/store: one typed column per field the
+# transcripts, statistics and search use (ids, author, timestamp as microseconds since
+# the Unix epoch, content and attachment/embed/mention counts), plus the attachment,
+# embed and mention details as JSON. Later conversions of the unchanged export (for
+# example with other display settings) read the store instead of parsing the JSON.
+# Fields that are missing and fields that are null are stored alike.
 
-    def print_banner():
-        print(Fore.BLACK + Back.CYAN + "*-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-*")
-        print(Fore.BLACK + Back.CYAN + "|" + Fore.WHITE + Back.BLACK + "            __________          __________               " + Fore.BLACK + Back.CYAN + "|")
-        print(Fore.BLACK + Back.CYAN + "|" + Fore.WHITE + Back.BLACK + "            \\______   \\ __  _  _\\_   ____/               " + Fore.BLACK + Back.CYAN + "|")
-        print(Fore.BLACK + Back.CYAN + ":" + Fore.WHITE + Back.BLACK + "             |    |  _//  \\/ \\/  /|   __)_               " + Fore.BLACK + Back.CYAN + ":")
-        print(Fore.BLACK + Back.CYAN + "." + Fore.WHITE + Back.BLACK + "             |    |   \\\\        //        \\              " + Fore.BLACK + Back.CYAN + ".")
-        print(Fore.BLACK + Back.CYAN + ":" + Fore.WHITE + Back.BLACK + "  /\\_/\\      |______  / \\__/\\__//_______  /              " + Fore.BLACK + Back.CYAN + ":")
-        print(Fore.BLACK + Back.CYAN + "|" + Fore.WHITE + Back.BLACK + " ( x.x )            \\/" + Fore.CYAN + " JSON Chat Parser " + Fore.WHITE + "\\/" + version + "          " + Fore.BLACK + Back.CYAN + "|")
-        print(Fore.BLACK + Back.CYAN + "|" + Fore.WHITE + Back.BLACK + " (>   <)                                                 " + Fore.BLACK + Back.CYAN + "|")
-        print(Fore.BLACK + Back.CYAN + "*-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-*" + Back.BLACK + Style.RESET_ALL + "\n")
+STORE_FOLDER = "store"
+_UNIX_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_STORE_COLUMNS = ("group_index, id, channel_id, author_id, username, global_name, "
+                  "timestamp, content, attachment_count, embed_count, mention_count, extra")
 
-    print_banner()
+def timestamp_micros(ts):
+    """Return an ISO timestamp as microseconds since the Unix epoch (UTC if no offset given), or None."""
+    try:
+        dt = datetime.fromisoformat(ts)
+    except (TypeError, ValueError):
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return (dt - _UNIX_EPOCH) // timedelta(microseconds=1)
 
-    output_folder = "Output"
-    # If output folder exists and contains .html files, ask user whether to start over or search.
-    if os.path.exists(output_folder):
-        html_files = [f for f in os.listdir(output_folder) if f.lower().endswith('.html')]
-        if html_files:
-            choice = input(Fore.YELLOW + f"Output Folder '{output_folder}' Already Exists And Contains {len(html_files)} HTML File(s).\n" + Style.RESET_ALL +
-                           "\nDo You Want To (R)escan (Delete Output Folder And Process JSON Files) Or (S)earch The Output Folder? [R/S]: ").strip().lower()
-            if choice == "s":
-                search_term = input("\nEnter Search Term: ").strip()
-                results = search_output(search_term, output_folder)
-                if results:
-                    print("\nSearch Term Found In The Following File(s):")
-                    for r in results:
-                        print(f"- {r}")
-                    input("\nPress Enter To Quit...")
-                    os._exit(0)
-                else:
-                    print("No Matches Found In Output Folder.")
-                    input("\nPress Enter To Quit...")
-                    os._exit(0)
-                return
-            elif choice == "r":
-                # Delete the output folder and its contents.
-                shutil.rmtree(output_folder)
-                os.makedirs(output_folder)
-                print("")
-            else:
-                input("\nPress Enter To Quit...")
-                os._exit(0)
+def micros_timestamp(micros):
+    """Return microseconds since the Unix epoch as a Discord-style ISO timestamp (UTC)."""
+    seconds, fraction = divmod(micros, 1000000)
+    days, seconds = divmod(seconds, 86400)
+    hours, seconds = divmod(seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+    return f"{_utc_date(days)}T{hours:02d}:{minutes:02d}:{seconds:02d}.{fraction:06d}+00:00"
 
-    json_files = [f for f in os.listdir('.') if f.lower().endswith('.json')]
-    if not json_files:
-        print(Fore.RED + "No JSON Files Found In The Current Directory." + Style.RESET_ALL)
-        input("\nPress Enter To Quit...")
-        os._exit(0)
+@lru_cache(maxsize=4096)
+def _utc_date(days):
+    # Messages come in time order, so the date part repeats from one message to the next.
+    return (_UNIX_EPOCH + timedelta(days=days)).date().isoformat()
 
-    # Statistics variables
-    total_files_processed = 0
-    file_type_counts = {"chat": 0, "dm": 0, "search": 0}
-    global_channel_ids = set()
-    global_participants = set()
+class MessageStoreWriter:
+    """Records one export's messages into a message store, written under a temporary name."""
 
-    # Dictionary to count output files per base name (for naming HTML files)
-    base_counts = {}
+    BATCH_SIZE = 1000
 
-    for filename in json_files:
-        filepath = os.path.join('.', filename)
-        file_type, html_content, data = process_json_file(filepath)
-        if file_type == "unknown" or html_content is None:
-            print(f"Skipping {filename} As Unknown Content Type.")
-            continue
+    def __init__(self, path):
+        self.path = path
+        self.temp_path = path + ".part"
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+        self.conn = sqlite3.connect(self.temp_path)
+        self.conn.execute(
+            "CREATE TABLE messages (seq INTEGER PRIMARY KEY, group_index INTEGER, id TEXT, "
+            "channel_id TEXT, author_id TEXT, username TEXT, global_name TEXT, timestamp INTEGER, "
+            "content TEXT, attachment_count INTEGER, embed_count INTEGER, mention_count INTEGER, extra TEXT)"
+        )
+        self.conn.execute("CREATE TABLE export (shape TEXT, meta TEXT, source_hash TEXT)")
+        self.rows = []
+        self.export = None
 
-        total_files_processed += 1
-        file_type_counts[file_type] += 1
+    def add(self, group_index, msg):
+        """Record a message; group_index as in stream_export's events."""
+        author = msg.get("author")
+        if not isinstance(author, dict):
+            author = {}
+        raw_ts = msg.get("timestamp")
+        micros = timestamp_micros(raw_ts)
+        extra = {}
+        if raw_ts is not None and (micros is None or micros_timestamp(micros) != raw_ts):
+            extra["timestamp"] = raw_ts
+        for key in ("edited_timestamp", "attachments", "embeds", "mentions"):
+            if msg.get(key):
+                extra[key] = msg[key]
+        self.rows.append((group_index, msg.get("id"), msg.get("channel_id"), author.get("id"),
+                          author.get("username"), author.get("global_name"), micros, msg.get("content"),
+                          len(msg.get("attachments") or ()), len(msg.get("embeds") or ()),
+                          len(msg.get("mentions") or ()),
+                          json.dumps(extra, separators=(",", ":")) if extra else None))
+        if len(self.rows) >= self.BATCH_SIZE:
+            self._flush()
 
-        # Extract channel IDs from this file and add to the global set.
-        ch_ids = extract_channel_ids(data, file_type)
-        global_channel_ids.update(ch_ids)
+    def _flush(self):
+        self.conn.executemany(f"INSERT INTO messages ({_STORE_COLUMNS}) "
+                              "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", self.rows)
+        self.rows = []
 
-        # For chat/dm files, derive base name from participants and update global_participants with all participants.
-        if file_type in ("chat", "dm"):
-            participants = extract_participants(data, file_type)
-            global_participants.update(participants)
-            if len(participants) == 0:
-                base_name = file_type
-            elif len(participants) == 1:
-                base_name = f"{file_type}_{participants[0]}"
-            elif len(participants) == 2:
-                base_name = f"{file_type}_{participants[0]}_{participants[1]}"
-            else:
-                base_name = f"{file_type}_multi"
-        elif file_type == "search":
-            base_name = f"search_{os.path.splitext(filename)[0]}"
+    def finish(self, shape, meta):
+        """Record the export's shape and top-level data (see stream_export) once all messages are added."""
+        self.export = (shape, json.dumps(meta, separators=(",", ":")))
+
+    def close(self, keep, source_hash):
+        """Finish the store and put it in place if keep (and finish was called), else drop it."""
+        self._flush()
+        if keep and self.export is not None:
+            self.conn.execute("INSERT INTO export VALUES (?, ?, ?)", self.export + (source_hash,))
+            self.conn.commit()
+            self.conn.close()
+            os.replace(self.temp_path, self.path)
         else:
-            base_name = file_type
+            self.conn.close()
+            os.remove(self.temp_path)
+
+def stored_message(row):
+    """Rebuild the message dict the renderer reads from a messages row (see _STORE_COLUMNS)."""
+    (_, message_id, channel_id, author_id, username, global_name, micros, content,
+     _, _, _, extra) = row
+    msg = json.loads(extra) if extra else {}
+    if micros is not None and "timestamp" not in msg:
+        msg["timestamp"] = micros_timestamp(micros)
+    if message_id is not None:
+        msg["id"] = message_id
+    if channel_id is not None:
+        msg["channel_id"] = channel_id
+    if content is not None:
+        msg["content"] = content
+    author = {key: value for key, value in (("id", author_id), ("username", username),
+                                            ("global_name", global_name)) if value is not None}
+    if author:
+        msg["author"] = author
+    return msg
+
+def open_message_store(path, source_hash=None):
+    """
+    Open a message store and return (shape, meta, events) like stream_export, or None if
+    there is none (or it was written for a different source_hash). The events read the
+    messages from disk as they are consumed.
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        conn = sqlite3.connect(path)
+        row = conn.execute("SELECT shape, meta, source_hash FROM export").fetchone()
+    except sqlite3.Error:
+        return None
+    if row is None or (source_hash is not None and row[2] != source_hash):
+        conn.close()
+        return None
+    shape, meta = row[0], json.loads(row[1])
+
+    def events():
+        try:
+            for message_row in conn.execute(f"SELECT {_STORE_COLUMNS} FROM messages ORDER BY seq"):
+                yield message_row[0], stored_message(message_row)
+        finally:
+            conn.close()
+    return shape, meta, events()
+
+def load_message_store(path):
+    """
+    Return a message store's export rebuilt as loaded JSON data (with only the fields the
+    store keeps), for process_*, detect_file_type and the extract_* functions. None if
+    there is no store at path.
+    """
+    stored = open_message_store(path)
+    if stored is None:
+        return None
+    shape, meta, events = stored
+    if shape == "list":
+        return [msg for _, msg in events]
+    data = dict(meta)
+    if "messages" in data:
+        groups = []
+        for group_index, msg in events:
+            # Groups that were not message lists hold no messages and stay empty.
+            while len(groups) <= group_index:
+                groups.append([])
+            groups[group_index].append(msg)
+        data["messages"] = groups
+    return data
+
+# ----------------- MERGE -----------------
+# With SETTINGS["merge_channels"], every export is first scanned into its message store
+# (which also yields its type and channel IDs). Chat and DM exports sharing a channel
+# ID are grouped, and each group of several exports is rendered as one transcript:
+# every store is read sorted by snowflake (SQLite sorts on disk), the sorted streams are
+# merged k-way, and copies of the same message next to each other in the merged stream
+# are reduced to the latest edit. Memory use does not depend on how many exports overlap.
+
+# Snowflake order, or for messages without a numeric ID one derived from their timestamp.
+_SNOWFLAKE_KEY = ("CASE WHEN id != '' AND id NOT GLOB '*[^0-9]*' THEN CAST(id AS INTEGER) "
+                  f"ELSE IFNULL((timestamp / 1000 - {DISCORD_EPOCH_MS}) << 22, 0) END")
+
+def scan_export(shape, meta, events, writer=None):
+    """
+    Return (file type, channel IDs) of an export from one pass over its events (see
+    stream_export), with the same rules as render_export, recording the messages in
+    writer (a MessageStoreWriter) if given.
+    """
+    channel_ids = set()
+    usernames = set()
+    for position, (group_index, msg) in enumerate(events):
+        if shape == "list" and position == 0 and not (isinstance(msg, dict) and "timestamp" in msg and "author" in msg):
+            return "unknown", set()
+        if len(usernames) <= 2 and "author" in msg:
+            usernames.add(msg["author"].get("username", "Unknown"))
+        if "channel_id" in msg:
+            channel_ids.add(msg["channel_id"])
+        if writer is not None:
+            writer.add(group_index, msg)
+    if shape == "list":
+        file_type = ("dm" if len(usernames) == 2 else "chat") if usernames else "unknown"
+    elif shape == "dict" and "messages" in meta and "total_results" in meta:
+        file_type = "search"
+    elif shape == "dict" and "messages" in meta and "channels" in meta:
+        file_type = "dm"
+    else:
+        file_type = "unknown"
+    if shape == "dict":
+        channel_ids.update(channel["id"] for channel in meta.get("channels", []) if "id" in channel)
+    if writer is not None and file_type != "unknown":
+        writer.finish(shape, meta)
+    return file_type, channel_ids
+
+def scan_file(filepath, output_folder):
+    """
+    Make sure an input has an up-to-date message store and return {"filepath",
+    "file_type", "channel_ids"} for merge_jobs. The JSON is streamed, so any size works.
+    """
+    try:
+        digest = file_digest(filepath)
+    except (OSError, KeyError, zipfile.BadZipFile) as e:
+        print(f"Error Loading {filepath}: {e}")
+        return {"filepath": filepath, "file_type": None, "channel_ids": set()}
+    store_path = message_store_path(output_folder, filepath)
+    stored = open_message_store(store_path, digest)
+    if stored is not None:
+        file_type, channel_ids = scan_export(*stored)
+    else:
+        writer = MessageStoreWriter(store_path)
+        try:
+            with open_export(filepath) as f:
+                file_type, channel_ids = scan_export(*stream_export(JsonStream(f)), writer)
+        except Exception as e:
+            print(f"Error Loading {filepath}: {e}")
+            file_type, channel_ids = None, set()
+        writer.close(keep=file_type not in (None, "unknown"), source_hash=digest)
+    return {"filepath": filepath, "file_type": file_type, "channel_ids": channel_ids}
+
+def merge_jobs(scans):
+    """
+    Group scanned inputs (see scan_file): chat and DM exports that share a channel ID,
+    directly or through other exports, form one group. Returns the conversion jobs in
+    input order: an input's file path, or a tuple of file paths for a group of several.
+    """
+    parent = list(range(len(scans)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    owner = {}
+    for i, scan in enumerate(scans):
+        if scan["file_type"] in ("chat", "dm"):
+            for channel_id in scan["channel_ids"]:
+                if channel_id in owner:
+                    parent[find(i)] = find(owner[channel_id])
+                else:
+                    owner[channel_id] = i
+    groups = {}
+    for i in range(len(scans)):
+        groups.setdefault(find(i), []).append(scans[i]["filepath"])
+    jobs = []
+    for i in range(len(scans)):
+        group = groups.pop(find(i), None)
+        if group is not None:
+            jobs.append(group[0] if len(group) == 1 else tuple(group))
+    return jobs
+
+def messages_by_snowflake(path):
+    """Yield (key, message ID, edit time, message) from a message store, newest first (see _SNOWFLAKE_KEY)."""
+    conn = sqlite3.connect(path)
+    try:
+        for row in conn.execute(f"SELECT {_STORE_COLUMNS}, {_SNOWFLAKE_KEY} AS sort_key "
+                                "FROM messages ORDER BY sort_key DESC, seq"):
+            msg = stored_message(row[:-1])
+            edited = timestamp_micros(msg.get("edited_timestamp"))
+            yield row[-1], row[1], edited if edited is not None else -1, msg
+    finally:
+        conn.close()
+
+def merged_messages(store_paths):
+    """
+    Yield the messages of several message stores merged newest first, like a chat export.
+    A message found in several stores is yielded once, in its most recently edited form.
+    """
+    streams = [messages_by_snowflake(path) for path in store_paths]
+    pending = None
+    for item in heapq.merge(*streams, key=lambda item: item[0], reverse=True):
+        if pending is not None and item[1] is not None and item[:2] == pending[:2]:
+            if item[2] > pending[2]:
+                pending = item
+            continue
+        if pending is not None:
+            yield pending[3]
+        pending = item
+    if pending is not None:
+        yield pending[3]
+
+def stored_meta(path):
+    """Return the (shape, meta) recorded in a message store."""
+    conn = sqlite3.connect(path)
+    try:
+        shape, meta = conn.execute("SELECT shape, meta FROM export").fetchone()
+    finally:
+        conn.close()
+    return shape, json.loads(meta)
+
+def merge_files(filepaths, output_folder):
+    """
+    Convert a group of exports of the same channel (see merge_jobs) into one temporary
+    transcript, from their message stores. Returns a result like convert_file, named
+    after all of the files.
+    """
+    stats = [source_stat(filepath) for filepath in filepaths]
+    digest = hashlib.blake2b(digest_size=20)
+    for filepath in filepaths:
+        digest.update(file_digest(filepath).encode("ascii"))
+    result = {"filename": " + ".join(source_basename(filepath) for filepath in filepaths),
+              "source": " + ".join(source_name(filepath) for filepath in filepaths),
+              "size": sum(st[0] for st in stats), "mtime_ns": max(st[1] for st in stats),
+              "hash": digest.hexdigest()}
+    store_paths = [message_store_path(output_folder, filepath) for filepath in filepaths]
+
+    def render(part_path, file_stats):
+        exports = [stored_meta(path) for path in store_paths]
+        messages = merged_messages(store_paths)
+        if all(shape == "dict" and "channels" in meta for shape, meta in exports):
+            # DM exports stay a DM export, with each channel listed once.
+            channels = {}
+            for _, meta in exports:
+                for channel in meta["channels"]:
+                    channels.setdefault(channel.get("id", len(channels)), channel)
+            meta = {"channels": list(channels.values()), "messages": None}
+            events = enumerate(messages)
+            return render_export("dict", meta, events, result["filename"], part_path, file_stats), True
+        for shape, meta in exports:
+            if shape == "dict":
+                collect_channels(meta, file_stats)
+        events = ((None, msg) for msg in messages)
+        return render_export("list", {}, events, result["filename"], part_path, file_stats), True
+
+    return run_conversion(result, temp_name(filepaths[0]) + ".merged", output_folder, render)
+
+def convert_job(job, output_folder):
+    """
+    Run one job from merge_jobs: convert_file for a single input, merge_files for a group.
+    An input that can no longer be read (removed or rewritten since it was listed) is
+    reported and skipped.
+    """
+    filepaths = list(job) if isinstance(job, tuple) else [job]
+    try:
+        if isinstance(job, tuple):
+            return merge_files(filepaths, output_folder)
+        return convert_file(job, output_folder)
+    except (OSError, KeyError, zipfile.BadZipFile) as e:
+        print(f"Error Loading {job}: {e}")
+        return {"filename": " + ".join(source_basename(filepath) for filepath in filepaths),
+                "source": " + ".join(source_name(filepath) for filepath in filepaths),
+                "file_type": None, "channel_ids": set(), "participants": [],
+                "part_path": None, "index_path": None, "paging": None, "media": [], "analytics": None,
+                "size": 0, "mtime_ns": 0, "hash": None}
+
+# ----------------- MEDIA -----------------
+# With SETTINGS["localize_media"], the image URLs of every converted transcript are
+# gathered while rendering, de-duplicated across files and downloaded concurrently into
+# Output/media, named by a hash of their content so identical files are stored once.
+# The transcripts' <img src> attributes are then pointed at the local copies; the
+# links next to them keep the original URLs. media/index.json records which URL was
+# saved as which file, so later runs only fetch what is missing, and an interrupted
+# download continues from its partial file.
+
+MEDIA_FOLDER = "media"
+MEDIA_INDEX_NAME = "index.json"
+MEDIA_TIMEOUT = 60
+MEDIA_CHUNK_SIZE = 1 << 16
+_IMG_SRC = re.compile(rb'<img src="([^"]*)"')
+
+def media_urls(msg):
+    """Return the image URLs format_message puts in <img> tags for msg."""
+    urls = []
+    if not SETTINGS.get("embed_images"):
+        urls.extend(att.get("url", "#") for att in msg.get("attachments", []))
+    for embed in msg.get("embeds", []):
+        if embed.get("image") and embed["image"].get("url"):
+            urls.append(embed["image"]["url"])
+        elif embed.get("thumbnail") and embed["thumbnail"].get("url"):
+            urls.append(embed["thumbnail"]["url"])
+    return [url for url in urls if url.startswith(("http://", "https://"))]
+
+def media_extension(url):
+    """Return a short, safe file extension for url (".bin" if it has none)."""
+    ext = os.path.splitext(urlsplit(url).path)[1].lower()
+    return ext if re.fullmatch(r"\.[a-z0-9]{1,8}", ext) else ".bin"
+
+def expected_media_size(response, have):
+    """
+    Return the full size of the file a media response delivers (counting the have bytes
+    already stored for a 206 response), None if the server did not say, or -1 if a 206
+    response does not continue at have.
+    """
+    if response.status == 206:
+        match = re.fullmatch(r"bytes (\d+)-\d+/(\d+|\*)", response.headers.get("Content-Range", "").strip())
+        if match is None or int(match.group(1)) != have:
+            return -1
+        return None if match.group(2) == "*" else int(match.group(2))
+    length = response.headers.get("Content-Length")
+    return int(length) if length and length.isdigit() else None
+
+def download_media(url, media_folder):
+    """
+    Download url into media_folder and return the stored file name, or None on failure.
+    The body goes to a partial file first, which is only kept as media once it has the
+    size the server announced; if one is left from an earlier run, only the rest is
+    requested (HTTP Range). Blocking, run in a thread by fetch_media.
+    """
+    url_hash = hashlib.blake2b(url.encode("utf-8"), digest_size=16).hexdigest()
+    part_path = os.path.join(media_folder, f".{url_hash}.part")
+    have = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    request = urllib.request.Request(url, headers={"User-Agent": "Mozilla/5.0"})
+    if have:
+        request.add_header("Range", f"bytes={have}-")
+    try:
+        with urllib.request.urlopen(request, timeout=MEDIA_TIMEOUT) as response:
+            expected = expected_media_size(response, have)
+            if expected == -1:
+                # The partial file does not line up with what the server sent; start over next time.
+                os.remove(part_path)
+                return None
+            # A server that ignores the Range header sends the whole file again.
+            with open(part_path, "ab" if response.status == 206 else "wb") as f:
+                for chunk in iter(lambda: response.read(MEDIA_CHUNK_SIZE), b""):
+                    f.write(chunk)
+    except urllib.error.HTTPError as e:
+        if e.code == 416:
+            # The partial file does not match what the server has; start over next time.
+            os.remove(part_path)
+        return None
+    except (urllib.error.URLError, http.client.HTTPException, OSError, ValueError):
+        # Whatever arrived stays in the partial file for the next run to continue.
+        return None
+    size = os.path.getsize(part_path)
+    if expected is not None and size != expected:
+        # Cut short: keep the partial file to resume from, unless it is somehow too long.
+        if size > expected:
+            os.remove(part_path)
+        return None
+    name = file_digest(part_path) + media_extension(url)
+    os.replace(part_path, os.path.join(media_folder, name))
+    return name
+
+async def fetch_media(urls, media_folder, connections):
+    """
+    Download urls concurrently, at most connections at a time, and return {url: file name}
+    for those that succeeded. Each of the connections workers takes the next URL from a
+    shared queue and runs the blocking download in its own thread.
+    """
+    queue = asyncio.Queue()
+    for url in urls:
+        queue.put_nowait(url)
+    saved = {}
+    loop = asyncio.get_running_loop()
+
+    async def worker(pool):
+        while not queue.empty():
+            url = queue.get_nowait()
+            try:
+                name = await loop.run_in_executor(pool, download_media, url, media_folder)
+            except Exception as e:
+                # One bad URL must not stop the other downloads (or the run).
+                print(f"Error Downloading {url}: {e}")
+                continue
+            if name is not None:
+                saved[url] = name
+
+    with ThreadPoolExecutor(max_workers=connections) as pool:
+        await asyncio.gather(*(worker(pool) for _ in range(min(connections, len(urls)))))
+    return saved
+
+def load_media_index(media_folder):
+    """Return the {url: file name} map of media already downloaded into media_folder."""
+    try:
+        with open(os.path.join(media_folder, MEDIA_INDEX_NAME), "r", encoding="utf-8") as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return {url: name for url, name in index.items() if os.path.exists(os.path.join(media_folder, name))}
+
+def localize_file(path, local, nav_offsets=()):
+    """
+    Point the <img src> URLs in the HTML file at path to their local copies (local maps
+    escaped URL bytes to relative path bytes). nav_offsets are the page navigation blocks of a
+    page written by write_pages; their new offsets are returned.
+    """
+    def replace(match):
+        local_path = local.get(match.group(1))
+        return b'<img src="' + local_path + b'"' if local_path is not None else match.group(0)
+
+    new_offsets = []
+    temp_path = path + ".media"
+    with open(path, "rb") as src, open(temp_path, "wb", buffering=WRITE_BUFFER_SIZE) as out:
+        for offset in list(nav_offsets) + [None]:
+            # Lines are read up to each navigation block so its new position is known.
+            while True:
+                line = src.readline() if offset is None else src.readline(offset - src.tell())
+                if not line:
+                    break
+                out.write(_IMG_SRC.sub(replace, line))
+            if offset is not None:
+                new_offsets.append(out.tell())
+    os.replace(temp_path, path)
+    return new_offsets
+
+def localize_media(results, output_folder):
+    """
+    Download the media of the given conversion results (see convert_files) that is not
+    stored yet and rewrite their transcripts to use it. Each result's media is replaced
+    by the URLs that could not be fetched, so a later run can retry them.
+    """
+    pending = [result for result in results if result.get("out_name") and result.get("media")]
+    if not pending:
+        return
+    media_folder = os.path.join(output_folder, MEDIA_FOLDER)
+    os.makedirs(media_folder, exist_ok=True)
+    saved = load_media_index(media_folder)
+    urls = sorted({url for result in pending for url in result["media"]})
+    missing = [url for url in urls if url not in saved]
+    print(f"\nDownloading {len(missing)} Of {len(urls)} Media Files ({len(urls) - len(missing)} Already Cached)...")
+    try:
+        if missing:
+            saved.update(asyncio.run(fetch_media(missing, media_folder, max(1, SETTINGS.get("media_connections", 8)))))
+    finally:
+        with open(os.path.join(media_folder, MEDIA_INDEX_NAME), "w", encoding="utf-8") as f:
+            json.dump(saved, f, indent=1)
+    failed = sum(url not in saved for url in missing)
+    if failed:
+        print(Fore.YELLOW + f"{failed} Media File(s) Could Not Be Downloaded; They Will Be Retried Next Run." + Style.RESET_ALL)
+
+    for result in pending:
+        # URLs appear escaped in the transcripts (see escape_html).
+        local = {escape_html(url).encode("utf-8"): f"{MEDIA_FOLDER}/{saved[url]}".encode("utf-8")
+                 for url in result["media"] if url in saved}
+        if local:
+            paging = result["paging"]
+            if paging:
+                for name, page in zip(page_names(result["out_name"], len(paging["pages"])), paging["pages"]):
+                    page["nav_offsets"] = localize_file(os.path.join(output_folder, name), local, page["nav_offsets"])
+            else:
+                localize_file(os.path.join(output_folder, result["out_name"]), local)
+        result["media"] = [url for url in result["media"] if url not in saved]
+
+# ----------------- ANALYTICS -----------------
+# With SETTINGS["analytics"], every rendered message also adds one row to a few compact
+# columns: time (seconds since the Unix epoch, from the timestamp or else the snowflake
+# ID, -1 if unknown), author and channel (codes into per-file tables), attachment and embed
+# counts and whether it was edited. Each file's columns are saved in Output/analytics
+# so unchanged files are not parsed again on (U)pdate runs. After the run the columns
+# of all files are concatenated and aggregated into analytics.json, analytics_*.csv and
+# the analytics.html dashboard: per user and per channel counts, daily, hourly and
+# weekday activity, attachment and embed volumes and edit rates. With NumPy installed
+# the aggregation works on whole arrays; otherwise the same totals come from plain loops.
+
+ANALYTICS_FOLDER = "analytics"
+ANALYTICS_NAME = "analytics.json"
+ANALYTICS_DASHBOARD_NAME = "analytics.html"
+# (column, array typecode) in the order they are stored.
+ANALYTICS_COLUMNS = (("time", "q"), ("author", "i"), ("channel", "i"),
+                     ("attachments", "i"), ("embeds", "i"), ("edited", "b"))
+ANALYTICS_SUMS = ("attachments", "embeds", "edited")
+# Rows in the dashboard's user and channel tables (the CSV files list all of them).
+ANALYTICS_DASHBOARD_ROWS = 50
+WEEKDAY_NAMES = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+DAY_SECONDS = 86400
+HOUR_SECONDS = 3600
+
+def timestamp_seconds(ts):
+    """Return an ISO timestamp as whole seconds since the Unix epoch (UTC if no offset given), or None."""
+    try:
+        dt = datetime.fromisoformat(ts)
+    except (TypeError, ValueError):
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp() // 1)
+
+class AnalyticsWriter:
+    """Collects the analytics columns of one export's messages while they are rendered (see render_message)."""
+
+    def __init__(self, path):
+        self.path = path
+        self.columns = {name: array(typecode) for name, typecode in ANALYTICS_COLUMNS}
+        (self.time_column, self.author_column, self.channel_column, self.attachment_column,
+         self.embed_column, self.edited_column) = self.columns.values()
+        self.author_codes = {}
+        self.authors = []
+        self.channel_codes = {}
+        self.channels = []
+
+    def add(self, msg, sender):
+        """Record a message whose author is displayed as sender."""
+        get = msg.get
+        author = get("author")
+        key = author.get("id") if isinstance(author, dict) else None
+        key = sender if key is None else str(key)
+        code = self.author_codes.get(key)
+        if code is None:
+            code = self.author_codes[key] = len(self.authors)
+            self.authors.append([key, sender])
+        self.author_column.append(code)
+        channel = get("channel_id")
+        code = self.channel_codes.get(channel)
+        if code is None:
+            code = self.channel_codes[channel] = len(self.channels)
+            self.channels.append("" if channel is None else str(channel))
+        self.channel_column.append(code)
+        seconds = timestamp_seconds(get("timestamp"))
+        if seconds is None:
+            snowflake = message_snowflake(msg)
+            seconds = -1 if snowflake is None else ((snowflake >> 22) + DISCORD_EPOCH_MS) // 1000
+        self.time_column.append(seconds)
+        attachments = get("attachments")
+        self.attachment_column.append(len(attachments) if attachments else 0)
+        embeds = get("embeds")
+        self.embed_column.append(len(embeds) if embeds else 0)
+        self.edited_column.append(1 if get("edited_timestamp") else 0)
+
+    def close(self, keep):
+        """
+        Save the columns if keep: a JSON header line (row count, byte order, author and
+        channel tables) followed by each column's raw bytes.
+        """
+        if not keep:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        header = {"count": len(self.columns["time"]), "byteorder": sys.byteorder,
+                  "columns": ANALYTICS_COLUMNS, "authors": self.authors, "channels": self.channels}
+        temp_path = self.path + ".part"
+        with open(temp_path, "wb") as f:
+            f.write(json.dumps(header, separators=(",", ":")).encode("utf-8") + b"\n")
+            for name, _ in ANALYTICS_COLUMNS:
+                self.columns[name].tofile(f)
+        os.replace(temp_path, self.path)
+
+def load_analytics_columns(path):
+    """
+    Return (columns, authors, channels) saved by AnalyticsWriter, with the columns as
+    NumPy arrays if NumPy is available, else as arrays. None if the file is unusable.
+    """
+    try:
+        with open(path, "rb") as f:
+            header = json.loads(f.readline())
+            count = header["count"]
+            columns = {}
+            for name, typecode in header["columns"]:
+                column = array(typecode)
+                data = f.read(count * column.itemsize)
+                if len(data) != count * column.itemsize:
+                    return None
+                if numpy is not None:
+                    column = numpy.frombuffer(data, dtype=typecode)
+                    if header["byteorder"] != sys.byteorder:
+                        column = column.byteswap()
+                else:
+                    column.frombytes(data)
+                    if header["byteorder"] != sys.byteorder:
+                        column.byteswap()
+                columns[name] = column
+    except (OSError, ValueError, KeyError):
+        return None
+    return columns, header["authors"], header["channels"]
+
+def analytics_groups(keys, size, columns=None, spans=False):
+    """
+    Count the messages of each group, keys giving every message's group number below
+    size, and with columns also total their ANALYTICS_SUMS columns. With spans, also
+    find each group's first and last known message time (None if it has none).
+    Returns a dict of lists.
+    """
+    if numpy is not None:
+        totals = {"messages": numpy.bincount(keys, minlength=size).tolist()}
+        for name in ANALYTICS_SUMS if columns is not None else ():
+            totals[name] = numpy.bincount(keys, weights=columns[name], minlength=size).astype(numpy.int64).tolist()
+        if spans:
+            # Sorting (group, time) pairs packed into one integer puts each group's
+            # first and last time at the ends of its run, much faster than ufunc.at.
+            times = columns["time"]
+            dated = times >= 0
+            packed = (keys[dated] << 34) | times[dated]
+            packed.sort()
+            bounds = numpy.searchsorted(packed, numpy.arange(size + 1, dtype=numpy.int64) << 34)
+            starts, ends = bounds[:-1], bounds[1:]
+            found = ends > starts
+            mask = (1 << 34) - 1
+            first = numpy.full(size, -1, dtype=numpy.int64)
+            last = numpy.full(size, -1, dtype=numpy.int64)
+            first[found] = packed[starts[found]] & mask
+            last[found] = packed[ends[found] - 1] & mask
+            totals["first"] = [None if value < 0 else value for value in first.tolist()]
+            totals["last"] = [None if value < 0 else value for value in last.tolist()]
+        return totals
+    messages = [0] * size
+    for key in keys:
+        messages[key] += 1
+    totals = {"messages": messages}
+    for name in ANALYTICS_SUMS if columns is not None else ():
+        sums = totals[name] = [0] * size
+        for key, value in zip(keys, columns[name]):
+            if value:
+                sums[key] += value
+    if spans:
+        first, last = [None] * size, [None] * size
+        for key, value in zip(keys, columns["time"]):
+            if value >= 0:
+                if first[key] is None or value < first[key]:
+                    first[key] = value
+                if last[key] is None or value > last[key]:
+                    last[key] = value
+        totals["first"], totals["last"] = first, last
+    return totals
+
+def dated_columns(columns):
+    """Return the columns restricted to messages with a known time (see ANALYTICS_COLUMNS)."""
+    if numpy is not None:
+        dated = columns["time"] >= 0
+        return {name: column[dated] for name, column in columns.items()}
+    rows = [i for i, value in enumerate(columns["time"]) if value >= 0]
+    return {name: array(column.typecode, [column[i] for i in rows]) for name, column in columns.items()}
+
+def time_keys(times, unit, modulo=None, offset=0):
+    """Return (times // unit + offset) % modulo (or without the modulo) for every time."""
+    if numpy is not None:
+        keys = times // unit + offset
+        return keys % modulo if modulo else keys
+    if modulo:
+        return [(value // unit + offset) % modulo for value in times]
+    return [value // unit + offset for value in times]
+
+def seconds_iso(seconds):
+    """Return seconds since the Unix epoch as an ISO time (UTC), or None."""
+    if seconds is None:
+        return None
+    return (_UNIX_EPOCH + timedelta(seconds=seconds)).isoformat()
+
+def rate(part, whole):
+    return round(part / whole, 4) if whole else 0.0
+
+def aggregate_analytics(results, output_folder):
+    """
+    Load and combine the analytics columns of the converted results (see convert_files)
+    and return the analytics summary written to analytics.json.
+    """
+    folder = os.path.join(output_folder, ANALYTICS_FOLDER)
+    authors, author_codes, channels, channel_codes = [], {}, [], {}
+    parts = {name: [] for name, _ in ANALYTICS_COLUMNS}
+    files = []
+    for result in results:
+        if not result.get("out_name") or not result.get("analytics"):
+            continue
+        loaded = load_analytics_columns(os.path.join(folder, result["analytics"]))
+        if loaded is None:
+            print(f"Analytics Of {result['filename']} Are Missing, Convert It Again To Include It.")
+            continue
+        columns, file_authors, file_channels = loaded
+        # Map the file's author and channel codes onto codes shared by all files.
+        author_map = []
+        for key, name in file_authors:
+            if key not in author_codes:
+                author_codes[key] = len(authors)
+                authors.append([key, name])
+            author_map.append(author_codes[key])
+        channel_map = []
+        for key in file_channels:
+            if key not in channel_codes:
+                channel_codes[key] = len(channels)
+                channels.append(key)
+            channel_map.append(channel_codes[key])
+        for name, mapping in (("author", author_map), ("channel", channel_map)):
+            if numpy is not None:
+                columns[name] = numpy.asarray(mapping, dtype=numpy.int64)[columns[name]]
+            else:
+                columns[name] = array("q", [mapping[code] for code in columns[name]])
+        for name, _ in ANALYTICS_COLUMNS:
+            parts[name].append(columns[name])
+        files.append({"out_name": result["out_name"], "source": result["source"], "messages": len(columns["time"])})
+
+    if numpy is not None:
+        columns = {name: numpy.concatenate(chunks) if chunks else numpy.zeros(0, dtype=typecode)
+                   for (name, typecode), chunks in zip(ANALYTICS_COLUMNS, parts.values())}
+        columns["author"] = columns["author"].astype(numpy.int64)
+        columns["channel"] = columns["channel"].astype(numpy.int64)
+        total = lambda name: int(columns[name].sum())
+    else:
+        columns = {}
+        for (name, typecode), chunks in zip(ANALYTICS_COLUMNS, parts.values()):
+            column = array("q" if name in ("author", "channel") else typecode)
+            for chunk in chunks:
+                column.extend(chunk)
+            columns[name] = column
+        total = lambda name: sum(columns[name])
+    messages = len(columns["time"])
+
+    users = analytics_groups(columns["author"], len(authors), columns, spans=True)
+    channel_totals = analytics_groups(columns["channel"], len(channels), columns, spans=True)
+    dated = dated_columns(columns)
+    times = dated["time"]
+    hourly = analytics_groups(time_keys(times, HOUR_SECONDS, 24), 24)["messages"]
+    # The Unix epoch was a Thursday (3 days after a Monday).
+    weekdays = analytics_groups(time_keys(times, DAY_SECONDS, 7, 3), 7)["messages"]
+    daily = []
+    first_time = last_time = None
+    if len(times):
+        first_time, last_time = (int(times.min()), int(times.max())) if numpy is not None else (min(times), max(times))
+        first_day, last_day = first_time // DAY_SECONDS, last_time // DAY_SECONDS
+        days = analytics_groups(time_keys(times, DAY_SECONDS, offset=-first_day), last_day - first_day + 1, dated)
+        for offset, count in enumerate(days["messages"]):
+            if count:
+                daily.append({"date": (_UNIX_EPOCH + timedelta(days=first_day + offset)).date().isoformat(),
+                              "messages": count, **{name: days[name][offset] for name in ANALYTICS_SUMS}})
+
+    def group_rows(keys, totals):
+        rows = []
+        for code, key in enumerate(keys):
+            count = totals["messages"][code]
+            rows.append({**key, "messages": count, **{name: totals[name][code] for name in ANALYTICS_SUMS},
+                         "edit_rate": rate(totals["edited"][code], count),
+                         "first": seconds_iso(totals["first"][code]), "last": seconds_iso(totals["last"][code])})
+        rows.sort(key=lambda row: -row["messages"])
+        return rows
+
+    edited = total("edited")
+    return {
+        "generated": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "numpy": numpy is not None,
+        "files": files,
+        "messages": messages,
+        "undated_messages": messages - len(times),
+        "first": seconds_iso(first_time),
+        "last": seconds_iso(last_time),
+        "attachments": total("attachments"),
+        "embeds": total("embeds"),
+        "edited": edited,
+        "edit_rate": rate(edited, messages),
+        "hourly_utc": hourly,
+        "weekday_utc": dict(zip(WEEKDAY_NAMES, weekdays)),
+        "daily": daily,
+        "users": group_rows([{"id": key, "name": name} for key, name in authors], users),
+        "channels": group_rows([{"id": key} for key in channels], channel_totals),
+    }
+
+def write_analytics_csv(path, rows, fields):
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fields, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(rows)
+
+def bar_rows(labels, counts):
+    """Return HTML table rows with a horizontal bar for each (label, count)."""
+    peak = max(counts, default=0) or 1
+    return "".join(f'<tr><td>{escape_html(label)}</td><td class="count">{count}</td>'
+                   f'<td class="bar"><div style="width:{count * 100 / peak:.1f}%"></div></td></tr>\n'
+                   for label, count in zip(labels, counts))
+
+def analytics_dashboard(summary):
+    """Return the analytics.html dashboard for an analytics summary (see aggregate_analytics)."""
+    parts = [html_document_head("Analytics"), """<style>
+  table { border-collapse: collapse; margin-bottom: 20px; }
+  td, th { padding: 2px 8px; text-align: left; }
+  td.count { text-align: right; }
+  td.bar { width: 400px; }
+  td.bar div { background: #5865f2; height: 12px; }
+  .days { display: flex; align-items: flex-end; height: 120px; border-bottom: 1px solid #ccc; margin-bottom: 20px; }
+  .days span { flex: 1; background: #5865f2; min-width: 1px; }
+</style>
+"""]
+    period = f"{summary['first']} To {summary['last']}" if summary["first"] else "N/A"
+    parts.append("<h2>Summary</h2>\n<table>\n")
+    for label, value in (("Files", len(summary["files"])), ("Messages", summary["messages"]),
+                         ("Period (UTC)", period), ("Users", len(summary["users"])),
+                         ("Channels", len(summary["channels"])), ("Attachments", summary["attachments"]),
+                         ("Embeds", summary["embeds"]),
+                         ("Edited", f"{summary['edited']} ({summary['edit_rate']:.1%})")):
+        parts.append(f"<tr><th>{label}</th><td>{escape_html(value)}</td></tr>\n")
+    parts.append("</table>\n")
+
+    parts.append("<h2>Daily Activity</h2>\n")
+    if summary["daily"]:
+        peak = max(day["messages"] for day in summary["daily"])
+        parts.append(f"<p>{summary['daily'][0]['date']} To {summary['daily'][-1]['date']} "
+                     f"(Busiest Day: {peak} Messages)</p>\n<div class=\"days\">")
+        parts.extend(f'<span style="height:{day["messages"] * 100 / peak:.1f}%" '
+                     f'title="{day["date"]}: {day["messages"]}"></span>' for day in summary["daily"])
+        parts.append("</div>\n")
+    else:
+        parts.append("<p>None</p>\n")
+    parts.append("<h2>Messages By Hour (UTC)</h2>\n<table>\n")
+    parts.append(bar_rows([f"{hour:02d}:00" for hour in range(24)], summary["hourly_utc"]))
+    parts.append("</table>\n<h2>Messages By Weekday (UTC)</h2>\n<table>\n")
+    parts.append(bar_rows(summary["weekday_utc"].keys(), summary["weekday_utc"].values()))
+    parts.append("</table>\n")
+
+    for title, rows, label in (("Users", summary["users"], lambda row: f"{row['name']} ({row['id']})"),
+                               ("Channels", summary["channels"], lambda row: row["id"] or "N/A")):
+        shown = rows[:ANALYTICS_DASHBOARD_ROWS]
+        parts.append(f"<h2>Top {title} ({len(shown)} Of {len(rows)})</h2>\n<table>\n"
+                     "<tr><th></th><th>Messages</th><th></th><th>Attachments</th><th>Embeds</th>"
+                     "<th>Edit Rate</th><th>First</th><th>Last</th></tr>\n")
+        peak = max((row["messages"] for row in shown), default=0) or 1
+        for row in shown:
+            parts.append(f'<tr><td>{escape_html(label(row))}</td><td class="count">{row["messages"]}</td>'
+                         f'<td class="bar"><div style="width:{row["messages"] * 100 / peak:.1f}%"></div></td>'
+                         f'<td class="count">{row["attachments"]}</td><td class="count">{row["embeds"]}</td>'
+                         f'<td class="count">{row["edit_rate"]:.1%}</td>'
+                         f'<td>{row["first"] or "N/A"}</td><td>{row["last"] or "N/A"}</td></tr>\n')
+        parts.append("</table>\n")
+    parts.append(HTML_DOCUMENT_TAIL)
+    return "".join(parts)
+
+def write_analytics(output_folder, results):
+    """
+    Aggregate the analytics of the converted results and write analytics.json,
+    analytics_users.csv, analytics_channels.csv, analytics_daily.csv and analytics.html
+    into output_folder. Column files of inputs no longer converted are removed. Returns
+    the dashboard's path.
+    """
+    summary = aggregate_analytics(results, output_folder)
+    with open(os.path.join(output_folder, ANALYTICS_NAME), "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=1)
+    group_fields = ["messages", *ANALYTICS_SUMS, "edit_rate", "first", "last"]
+    write_analytics_csv(os.path.join(output_folder, "analytics_users.csv"), summary["users"], ["id", "name"] + group_fields)
+    write_analytics_csv(os.path.join(output_folder, "analytics_channels.csv"), summary["channels"], ["id"] + group_fields)
+    write_analytics_csv(os.path.join(output_folder, "analytics_daily.csv"), summary["daily"],
+                        ["date", "messages", *ANALYTICS_SUMS])
+    dashboard_path = os.path.join(output_folder, ANALYTICS_DASHBOARD_NAME)
+    with open(dashboard_path, "w", encoding="utf-8") as f:
+        f.write(analytics_dashboard(summary))
+    folder = os.path.join(output_folder, ANALYTICS_FOLDER)
+    used = {result.get("analytics") for result in results if result.get("out_name")}
+    if os.path.isdir(folder):
+        for name in os.listdir(folder):
+            if name not in used:
+                os.remove(os.path.join(folder, name))
+    return dashboard_path
+
+# ----------------- RUN REPORT -----------------
+# Every conversion writes Output/run_report.json next to stats.txt: the run's own
+# stages, and per file the messages rendered, bytes in and out, seconds per stage,
+# throughput and peak memory, so slow exports and regressions can be found without
+# guessing. The file stages are load (parsing the JSON, or reading the message store),
+# detect (loaded files only; otherwise detection happens while rendering), render,
+# write (spooled messages into the transcript or pages), store and index (closing
+# the message store and search index). SETTINGS["profile"] adds cProfile or
+# tracemalloc results.
+
+RUN_REPORT_NAME = "run_report.json"
+PROFILE_FOLDER = "profile"
+PROFILE_SUMMARY_NAME = "profile.txt"
+# Functions listed in profile.txt, and allocation sites per file with tracemalloc.
+PROFILE_TOP = 40
+TRACEMALLOC_TOP = 10
+
+def add_timing(stats, stage, seconds):
+    """Add seconds to stats["timings"][stage], if stats collects timings."""
+    timings = stats.get("timings") if stats is not None else None
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+@contextlib.contextmanager
+def timed(stats, stage):
+    """Time the with block as (part of) stage in stats (see add_timing)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_timing(stats, stage, time.perf_counter() - start)
+
+def timed_events(events, timings):
+    """Yield from events, adding the time spent waiting for each one to timings["load"]."""
+    iterator = iter(events)
+    clock = time.perf_counter
+    while True:
+        start = clock()
+        try:
+            event = next(iterator)
+        except StopIteration:
+            timings["load"] = timings.get("load", 0.0) + clock() - start
+            return
+        timings["load"] = timings.get("load", 0.0) + clock() - start
+        yield event
+
+def peak_rss_mb(children=False):
+    """
+    Return the peak resident set size in MB of this process (or, with children, of its
+    largest finished child process), or None if unavailable.
+    """
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+        # Linux reports kilobytes, macOS bytes.
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    except ImportError:
+        pass
+    if children:
+        return None
+    try:
+        from ctypes import wintypes
+
+        class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+            _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD),
+                        ("PeakWorkingSetSize", ctypes.c_size_t), ("WorkingSetSize", ctypes.c_size_t),
+                        ("QuotaPeakPagedPoolUsage", ctypes.c_size_t), ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                        ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t), ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                        ("PagefileUsage", ctypes.c_size_t), ("PeakPagefileUsage", ctypes.c_size_t)]
+
+        counters = PROCESS_MEMORY_COUNTERS()
+        counters.cb = ctypes.sizeof(counters)
+        handle = ctypes.windll.kernel32.GetCurrentProcess()
+        if ctypes.windll.psapi.GetProcessMemoryInfo(handle, ctypes.byref(counters), counters.cb):
+            return counters.PeakWorkingSetSize / (1024 * 1024)
+    except (AttributeError, OSError):
+        pass
+    return None
+
+def throughput(amount, seconds):
+    return round(amount / seconds, 3) if seconds else 0.0
+
+def file_report(result, stats, start, outputs):
+    """
+    Return the run report entry of a file converted by run_conversion (started at
+    perf_counter start, written to the outputs paths): messages rendered, bytes in (the
+    source as stored) and out, seconds in total and per stage, messages and MB (in) per
+    second, and the peak RSS of the converting process so far. While tracemalloc is
+    tracing, also the file's peak traced memory and its largest allocation sites.
+    """
+    seconds = time.perf_counter() - start
+    bytes_out = sum(os.path.getsize(path) for path in outputs if os.path.exists(path))
+    report = {"messages": stats["messages"], "bytes_in": result["size"], "bytes_out": bytes_out,
+              "seconds": round(seconds, 6),
+              "timings": {stage: round(spent, 6) for stage, spent in stats["timings"].items()},
+              "messages_per_sec": throughput(stats["messages"], seconds),
+              "mb_per_sec": throughput(result["size"] / (1024 * 1024), seconds),
+              "peak_rss_mb": peak_rss_mb()}
+    if tracemalloc.is_tracing():
+        report["tracemalloc_peak_mb"] = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+        snapshot = tracemalloc.take_snapshot().filter_traces((tracemalloc.Filter(False, tracemalloc.__file__),))
+        report["top_allocations"] = [
+            f"{stat.traceback[0].filename}:{stat.traceback[0].lineno} {stat.size / 1024:.1f} KiB in {stat.count} Blocks"
+            for stat in snapshot.statistics("lineno")[:TRACEMALLOC_TOP]]
+    return report
+
+def profiled(func, item, output_folder):
+    """Run func(item, output_folder) under cProfile (in a worker process), saving the stats in the profile folder."""
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(func, item, output_folder)
+    finally:
+        first = item if isinstance(item, str) else item[0]
+        profiler.dump_stats(os.path.join(output_folder, PROFILE_FOLDER, f"{func.__name__}{temp_name(first)}.prof"))
+
+def write_profile_summary(output_folder):
+    """Write the combined cProfile stats of the profile folder, by cumulative time, to profile.txt. Returns its path."""
+    folder = os.path.join(output_folder, PROFILE_FOLDER)
+    paths = sorted(glob.glob(os.path.join(glob.escape(folder), "*.prof")))
+    summary_path = os.path.join(folder, PROFILE_SUMMARY_NAME)
+    with open(summary_path, "w", encoding="utf-8") as f:
+        pstats.Stats(*paths, stream=f).sort_stats("cumulative").print_stats(PROFILE_TOP)
+    return summary_path
+
+def write_run_report(output_folder, results, run_stats, started, seconds, workers):
+    """
+    Write run_report.json for a convert_files run (started at Unix time started and
+    lasting seconds). run_stats["timings"] holds the run's own stages.
+    """
+    files = []
+    totals = {"messages": 0, "bytes_in": 0, "bytes_out": 0}
+    file_stages = {}
+    for result in results:
+        report = result.get("report") or {}
+        for key in totals:
+            totals[key] += report.get(key, 0)
+        for stage, spent in report.get("timings", {}).items():
+            file_stages[stage] = file_stages.get(stage, 0.0) + spent
+        files.append({"source": result["source"], "filename": result["filename"],
+                      "out_name": result.get("out_name"), "file_type": result["file_type"],
+                      "cached": result.get("cached", False), **report})
+    report = {"started": datetime.fromtimestamp(started, timezone.utc).isoformat(),
+              "seconds": round(seconds, 6), "workers": workers, "settings": dict(SETTINGS),
+              "stages": {stage: round(spent, 6) for stage, spent in run_stats["timings"].items()},
+              "file_stages": {stage: round(spent, 6) for stage, spent in file_stages.items()},
+              **totals,
+              "messages_per_sec": throughput(totals["messages"], seconds),
+              "mb_per_sec": throughput(totals["bytes_in"] / (1024 * 1024), seconds),
+              "peak_rss_mb": peak_rss_mb(), "worker_peak_rss_mb": peak_rss_mb(children=True) if workers > 1 else None}
+    if "tracemalloc_peak_mb" in run_stats:
+        report["tracemalloc_peak_mb"] = run_stats["tracemalloc_peak_mb"]
+    report["files"] = files
+    report_path = os.path.join(output_folder, RUN_REPORT_NAME)
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=1)
+    return report_path
+
+# ----------------- MANIFEST -----------------
+# Output/manifest.json remembers, per source file, its size, mtime and content hash,
+# the output it produced and its statistics, plus the SETTINGS used. An (U)pdate run
+# only converts new or changed files and reuses the rest.
+
+MANIFEST_NAME = "manifest.json"
+# SETTINGS that do not change the generated output.
+MANIFEST_IGNORED_SETTINGS = ("workers", "stream_threshold_mb", "media_connections", "message_store", "profile")
+
+def file_digest(filepath):
+    """
+    Return a hex BLAKE2b hash of the file's contents, read in chunks. Compressed files
+    are hashed as stored; zip members by their recorded CRC-32 and sizes, which avoids
+    decompressing them only to hash them.
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    path, member = split_source(filepath)
+    if member is not None:
+        with zipfile.ZipFile(path) as archive:
+            info = archive.getinfo(member)
+        digest.update(f"{info.CRC}:{info.file_size}:{info.compress_size}".encode("ascii"))
+        return digest.hexdigest()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def manifest_settings():
+    """Return the SETTINGS that affect the output, as recorded in the manifest."""
+    return {key: value for key, value in SETTINGS.items() if key not in MANIFEST_IGNORED_SETTINGS}
+
+def load_manifest(output_folder):
+    """Return (file entries by source filename, True if they were made with the current SETTINGS)."""
+    try:
+        with open(os.path.join(output_folder, MANIFEST_NAME), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}, False
+    return manifest.get("files", {}), manifest.get("settings") == manifest_settings()
+
+def write_manifest(output_folder, results):
+    """Write the manifest for the given conversion results (see convert_files)."""
+    files = {}
+    for result in results:
+        if result["file_type"] is None:
+            continue
+        files[result["source"]] = {
+            "size": result["size"],
+            "mtime_ns": result["mtime_ns"],
+            "hash": result["hash"],
+            "output": result["out_name"],
+            "file_type": result["file_type"],
+            "channel_ids": sorted(result["channel_ids"], key=str),
+            "participants": result["participants"],
+            "paging": result["paging"],
+            "media": result["media"],
+            "analytics": result.get("analytics"),
+        }
+    with open(os.path.join(output_folder, MANIFEST_NAME), "w", encoding="utf-8") as f:
+        json.dump({"settings": manifest_settings(), "files": files}, f, indent=1)
 
-        base_name = sanitize_filename(base_name)
+def cached_result(filepath, entry, output_folder, held=False):
+    """
+    Return a conversion result rebuilt from a manifest entry if the file is unchanged
+    (same size and mtime, or same content hash) and its output still exists, else None.
+    A held file keeps its entry whatever its current state.
+    """
+    if entry is None:
+        return None
+    if entry["output"] and not os.path.exists(os.path.join(output_folder, entry["output"])):
+        return None
+    if held:
+        size, mtime_ns = entry["size"], entry["mtime_ns"]
+    else:
+        try:
+            size, mtime_ns, _ = source_stat(filepath)
+        except (OSError, KeyError, zipfile.BadZipFile):
+            return None
+        if size != entry["size"]:
+            return None
+        if mtime_ns != entry["mtime_ns"] and file_digest(filepath) != entry["hash"]:
+            return None
+    return {"filename": source_basename(filepath), "source": source_name(filepath),
+            "file_type": entry["file_type"],
+            "channel_ids": set(entry["channel_ids"]), "participants": entry["participants"],
+            "part_path": None, "index_path": None, "paging": entry.get("paging"),
+            "media": entry.get("media", []), "analytics": entry.get("analytics"),
+            "size": size, "mtime_ns": mtime_ns, "hash": entry["hash"],
+            "cached": True, "previous_output": entry["output"]}
+
+def convert_files(filepaths, output_folder, incremental=False, quiet=False, held=()):
+    """
+    Convert JSON exports into HTML transcripts in output_folder and return their results
+    (see convert_file) in input order, each with out_name and cached. With incremental,
+    unchanged files (and held ones, see watch) keep their transcripts; quiet leaves them unlisted.
+    """
+    started, run_start = time.time(), time.perf_counter()
+    run_stats = {"timings": {}}
+    profile = SETTINGS.get("profile")
+    os.makedirs(output_folder, exist_ok=True)
+    profiler = None
+    if profile == "cprofile":
+        shutil.rmtree(os.path.join(output_folder, PROFILE_FOLDER), ignore_errors=True)
+        os.makedirs(os.path.join(output_folder, PROFILE_FOLDER))
+        profiler = cProfile.Profile()
+        profiler.enable()
+    elif profile == "tracemalloc" and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    index_file = os.path.join(output_folder, SEARCH_INDEX_NAME)
+    previous, reusable = load_manifest(output_folder) if incremental else ({}, False)
+    # Without a manifest the index cannot be updated file by file, so it is rebuilt.
+    if not previous and os.path.exists(index_file):
+        os.remove(index_file)
+
+    workers = SETTINGS.get("workers", 1) or os.cpu_count() or 1
+    pool = None
+
+    def run_all(func, items):
+        # func(item, output_folder) for every item, in worker processes if there are several.
+        nonlocal pool
+        if workers > 1 and len(items) > 1:
+            if pool is None:
+                pool = ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(dict(SETTINGS),))
+            if profiler is not None:
+                # The parent's profiler does not see into the workers, so each job is profiled there.
+                func = partial(profiled, func)
+            return pool.map(func, items, repeat(output_folder))
+        return map(func, items, repeat(output_folder))
+
+    jobs = filepaths
+    if SETTINGS.get("merge_channels"):
+        with timed(run_stats, "scan"):
+            jobs = merge_jobs(list(run_all(scan_file, filepaths)))
+
+    results = []
+    todo = []
+    for job in jobs:
+        # Merged transcripts are always rebuilt.
+        cached = None
+        if reusable and isinstance(job, str):
+            cached = cached_result(job, previous.get(source_name(job)), output_folder, job in held)
+        results.append(cached)
+        if cached is None:
+            todo.append(job)
+
+    index_conn = open_search_index(output_folder) if previous and os.path.exists(index_file) else None
+
+    def output_files(name, paging):
+        # The transcript, or the index page followed by its pages.
+        return [name] + (page_names(name, len(paging["pages"])) if paging else [])
+
+    # Outputs of changed or removed sources are deleted, with their index rows.
+    kept = {result["previous_output"] for result in results if result is not None}
+    for entry in previous.values():
+        old_name = entry.get("output")
+        if old_name and old_name not in kept:
+            for name in output_files(old_name, entry.get("paging")):
+                if os.path.exists(os.path.join(output_folder, name)):
+                    os.remove(os.path.join(output_folder, name))
+            if index_conn is not None:
+                index_conn.execute("DELETE FROM messages WHERE file = ?", (old_name,))
+                index_conn.execute("DELETE FROM pages WHERE file = ?", (old_name,))
+    # Where each reused transcript currently lives, so it can be moved aside if its name is needed.
+    location = {result["previous_output"]: result for result in results
+                if result is not None and result["previous_output"]}
+
+    def move_output(result, old_name, new_name):
+        for old, new in zip(output_files(old_name, result["paging"]), output_files(new_name, result["paging"])):
+            os.replace(os.path.join(output_folder, old), os.path.join(output_folder, new))
+        if index_conn is not None:
+            index_conn.execute("UPDATE messages SET file = ? WHERE file = ?", (new_name, old_name))
+            index_conn.execute("UPDATE pages SET file = ? WHERE file = ?", (new_name, old_name))
+
+    def claim(out_name, owner):
+        # Move a reused transcript that still occupies out_name out of the way.
+        holder = location.get(out_name)
+        if holder is not None and holder is not owner:
+            temp_name = f".{out_name}.move"
+            move_output(holder, out_name, temp_name)
+            del location[out_name]
+            location[temp_name] = holder
+            holder["previous_output"] = temp_name
+
+    converted = run_all(convert_job, todo)
+
+    # Dictionary to count output files per base name (for naming HTML files)
+    base_counts = {}
+
+    for i, result in enumerate(results):
+        if result is None:
+            # map() yields in submission order, which is input order.
+            with timed(run_stats, "convert"):
+                result = next(converted)
+            result["cached"] = False
+            results[i] = result
+        filename = result["filename"]
+        file_type = result["file_type"]
+        result["out_name"] = None
+        if file_type in (None, "unknown"):
+            print(f"Skipping {filename} As Unknown Content Type.")
+            continue
+
+        base_name = output_base_name(file_type, result["participants"], filename)
         count = base_counts.get(base_name, 0) + 1
         base_counts[base_name] = count
         out_name = f"{base_name}.html" if count == 1 else f"{base_name}_{count}.html"
         out_path = os.path.join(output_folder, out_name)
-        with open(out_path, "w", encoding="utf-8") as f:
-            f.write(html_content)
+        result["out_name"] = out_name
+        claim(out_name, result)
+        if result["cached"]:
+            if result["previous_output"] != out_name:
+                del location[result["previous_output"]]
+                move_output(result, result["previous_output"], out_name)
+                if result["paging"]:
+                    link_pages(output_folder, out_name, result["paging"])
+            if not quiet:
+                print(f"Kept {filename} As {file_type.upper()} (Unchanged) In {out_path}")
+            continue
+
+        paging = result["paging"]
+        if paging:
+            for number, name in enumerate(page_names(out_name, len(paging["pages"])), 1):
+                os.replace(f"{result['part_path']}_{number:04d}", os.path.join(output_folder, name))
+            link_pages(output_folder, out_name, paging)
+        else:
+            os.replace(result["part_path"], out_path)
+        if result["index_path"]:
+            with timed(run_stats, "index"):
+                if index_conn is None:
+                    index_conn = open_search_index(output_folder)
+                merge_file_index(index_conn, result["index_path"], out_name,
+                                 SETTINGS.get("messages_per_page") if paging else None)
         print(Fore.GREEN + f"Processed {filename} As {file_type.upper()} And Wrote Transcript To {out_path}" + Style.RESET_ALL)
 
-    # Prepare statistics output.
+    if pool is not None:
+        pool.shutdown()
+    if index_conn is not None:
+        with timed(run_stats, "index"):
+            index_conn.commit()
+            index_conn.close()
+    if SETTINGS.get("localize_media"):
+        with timed(run_stats, "media"):
+            localize_media(results, output_folder)
+    with timed(run_stats, "manifest"):
+        write_manifest(output_folder, results)
+    if SETTINGS.get("analytics"):
+        with timed(run_stats, "analytics"):
+            print(f"Analytics Written To {write_analytics(output_folder, results)}")
+    if profiler is not None:
+        profiler.disable()
+        profiler.dump_stats(os.path.join(output_folder, PROFILE_FOLDER, "run.prof"))
+        print(f"Profile Written To {write_profile_summary(output_folder)}")
+    elif profile == "tracemalloc":
+        # Each file resets the peak (see run_conversion), so theirs count too.
+        peaks = [result["report"]["tracemalloc_peak_mb"] for result in results
+                 if "tracemalloc_peak_mb" in result.get("report", {})]
+        run_stats["tracemalloc_peak_mb"] = max(peaks + [tracemalloc.get_traced_memory()[1] / (1024 * 1024)])
+        tracemalloc.stop()
+    write_run_report(output_folder, results, run_stats, started, time.perf_counter() - run_start, workers)
+    return results
+
+def statistics_text(results):
+    """Build the statistics summary (as printed and written to stats.txt) from conversion results."""
+    total_files_processed = 0
+    file_type_counts = {"chat": 0, "dm": 0, "search": 0}
+    global_channel_ids = set()
+    global_participants = set()
+    cache_counts = {"timestamps": [0, 0]}
+
+    for result in results:
+        file_type = result["file_type"]
+        for name, counts in result.get("cache_counts", {}).items():
+            cache_counts[name] = [total + count for total, count in zip(cache_counts[name], counts)]
+        if result["out_name"] is None:
+            continue
+
+        total_files_processed += 1
+        file_type_counts[file_type] += 1
+
+        # Add this file's channel IDs to the global set.
+        global_channel_ids.update(result["channel_ids"])
+
+        # For chat/dm files, update global_participants with all participants.
+        if file_type in ("chat", "dm"):
+            global_participants.update(result["participants"])
+
     stats_lines = []
     stats_lines.append(Fore.CYAN + "=== Statistics ===" + Style.RESET_ALL)
     stats_lines.append(f"Total Files Processed: {total_files_processed}")
     stats_lines.append(f"Chat Files: {file_type_counts.get('chat', 0)}")
     stats_lines.append(f"DM Files: {file_type_counts.get('dm', 0)}")
     stats_lines.append(f"Search Files: {file_type_counts.get('search', 0)}")
+    stats_lines.append(f"Timestamp Format Cache: {cache_counts['timestamps'][0]} Hits / {cache_counts['timestamps'][1]} Misses")
+    filters = [f"{key[len('filter_'):]}={SETTINGS[key]}" for key in FILTER_SETTINGS if SETTINGS.get(key)]
+    if filters:
+        stats_lines.append(f"Filters: {', '.join(filters)}")
     stats_lines.append("")
     stats_lines.append(Fore.CYAN + "Unique Channel IDs:" + Style.RESET_ALL)
     if global_channel_ids:
@@ -478,28 +3045,451 @@ def main():
         stats_lines.extend(sorted(global_participants))
     else:
         stats_lines.append("None")
-    stats_text = "\n".join(stats_lines)
+    return "\n".join(stats_lines)
 
-    # Output statistics to console.
-    print("\n" + stats_text)
-    # Also write statistics to stats.txt inside the output folder.
+def write_statistics(stats_text, output_folder):
+    """Write the statistics summary to stats.txt in output_folder and return its path."""
     stats_path = os.path.join(output_folder, "stats.txt")
     with open(stats_path, "w", encoding="utf-8") as f:
         f.write(stats_text)
+    return stats_path
+
+# ----------------- WATCH -----------------
+# watch() keeps an output folder up to date with input directories that exports keep
+# landing in. Each export is converted once it has finished being written: its size
+# and mtime must hold still for WATCH_SETTLE_SECONDS (and a .zip must be complete).
+# Every pass is an incremental convert_files run, so files already converted are only
+# checked, the search index gains just the new transcripts and stats.txt is rebuilt
+# from the manifest. On Linux, inotify wakes the loop as soon as something changes in
+# a watched directory; elsewhere (and as a safety net) the inputs are polled.
+
+WATCH_SETTLE_SECONDS = 2.0
+WATCH_POLL_SECONDS = 2.0
+# With inotify, how often the inputs are rescanned anyway, for example for changes in
+# subdirectories matched by a recursive glob, which inotify does not report.
+WATCH_RESCAN_SECONDS = 60.0
+
+class InotifyWatcher:
+    """Waits for files to be created, written, moved or deleted in directories, using Linux inotify."""
+
+    IN_CLOSE_WRITE = 0x008
+    IN_MOVED_FROM = 0x040
+    IN_MOVED_TO = 0x080
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    # Plain writes (IN_MODIFY) are left out: a file counts as written once it settles.
+    MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+    rescan_seconds = WATCH_RESCAN_SECONDS
+
+    def __init__(self, directories):
+        libc = ctypes.CDLL(None, use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 Failed")
+        for directory in directories:
+            if libc.inotify_add_watch(self.fd, os.fsencode(directory), self.MASK) < 0:
+                error = ctypes.get_errno()
+                self.close()
+                raise OSError(error, f"Cannot Watch {directory}")
+
+    def wait(self, timeout):
+        """Return once there are events (which are discarded) or after timeout seconds."""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if ready:
+            try:
+                while os.read(self.fd, 65536):
+                    pass
+            except BlockingIOError:
+                pass
+
+    def close(self):
+        os.close(self.fd)
+
+class PollingWatcher:
+    """Stand-in for InotifyWatcher where inotify is unavailable: waiting just sleeps."""
+
+    rescan_seconds = WATCH_POLL_SECONDS
+
+    def wait(self, timeout):
+        time.sleep(timeout)
+
+    def close(self):
+        pass
+
+def watched_directories(paths):
+    """Return the existing directories whose entries decide what the input paths match."""
+    directories = []
+    for path in paths:
+        path = split_source(path)[0]
+        if not os.path.isdir(path):
+            # A file's folder, or the part of a glob pattern before its first wildcard.
+            path = os.path.dirname(path)
+            while glob.has_magic(path):
+                path = os.path.dirname(path)
+        path = os.path.abspath(path or ".")
+        if os.path.isdir(path) and path not in directories:
+            directories.append(path)
+    return directories
+
+def file_watcher(directories):
+    """Return an InotifyWatcher for directories where inotify works, else a PollingWatcher."""
+    if sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(directories)
+        except (OSError, AttributeError) as e:
+            print(f"Cannot Use inotify ({e}), Polling Instead.")
+    return PollingWatcher()
+
+def source_settled(source, signature, previous, now, settle):
+    """
+    Return whether an input (signature being its (size, mtime_ns)) looks completely
+    written: unchanged since the previous scan and not modified for settle seconds. An
+    archive must also be readable as one, as its directory is written last.
+    """
+    if previous is not None and previous != signature:
+        return False
+    if now - signature[1] / 1e9 < settle:
+        return False
+    return not is_archive(source) or zipfile.is_zipfile(split_source(source)[0])
+
+def watch(paths, output_folder="Output", settings=None, workers=None, settle=WATCH_SETTLE_SECONDS):
+    """
+    Convert the exports given by paths (see input_sources) into output_folder like
+    convert(incremental=True), then keep watching them and convert every export that
+    is added or changed once it has settled (see source_settled), until interrupted.
+    Removed exports have their transcripts removed. stats.txt is rewritten after
+    every pass. settings and workers are applied as in convert.
+    """
+    saved = dict(SETTINGS)
+    SETTINGS.update(settings or {})
+    if workers is not None:
+        SETTINGS["workers"] = workers
+    watcher = file_watcher(watched_directories(paths))
+    print(f"Watching {', '.join(paths)} (Press Ctrl+C To Stop)...")
+    # (size, mtime_ns) of each input when it was last converted, and at the last scan,
+    # and the files each converted input was made of.
+    converted = {}
+    seen = {}
+    members = {}
+    try:
+        while True:
+            now = time.time()
+            current = {}
+            for source in input_sources(paths, quiet=True):
+                try:
+                    st = os.stat(split_source(source)[0])
+                except OSError:
+                    continue
+                current[source] = (st.st_size, st.st_mtime_ns)
+            ready = [source for source, signature in current.items() if converted.get(source) != signature
+                     and source_settled(source, signature, seen.get(source), now, settle)]
+            waiting = any(converted.get(source) != signature and source not in ready
+                          for source, signature in current.items())
+            removed = converted.keys() - current.keys()
+            seen = current
+            if ready or removed:
+                # Exports still being written sit this pass out: new ones are left out,
+                # converted ones keep their previous transcripts.
+                held = [source for source in current if source in converted and source not in ready]
+                try:
+                    listed = {source: members[source] if source in held
+                              else archive_members(source) if is_archive(source) else [source]
+                              for source in current if source in ready or source in held}
+                    filepaths = []
+                    for files in listed.values():
+                        for filepath in files:
+                            if filepath not in filepaths:
+                                filepaths.append(filepath)
+                    held_files = {filepath for source in held for filepath in members[source]}
+                    results = convert_files(filepaths, output_folder, incremental=True, quiet=True, held=held_files)
+                    write_statistics(statistics_text(results), output_folder)
+                except Exception as e:
+                    # Tried again on the next pass.
+                    print(Fore.RED + f"Error Converting: {e}" + Style.RESET_ALL)
+                else:
+                    converted = {source: converted[source] if source in held else current[source] for source in listed}
+                    members = listed
+                    changed = sum(not result.get("cached") for result in results)
+                    print(Fore.CYAN + f"[{datetime.now():%H:%M:%S}] Converted {changed} Export(s), "
+                          f"{len(results)} In Total." + Style.RESET_ALL)
+            watcher.wait(min(settle, watcher.rescan_seconds) if waiting else watcher.rescan_seconds)
+    except KeyboardInterrupt:
+        print("\nStopped Watching.")
+    finally:
+        watcher.close()
+        SETTINGS.clear()
+        SETTINGS.update(saved)
+
+# ----------------- HEADLESS -----------------
+# convert() is the library entry point and cli() the non-interactive command line;
+# neither prompts, and both run on any OS.
+
+def input_sources(paths, quiet=False):
+    """
+    Return the existing files (and archive members) named by input paths, before
+    archives are expanded: files are kept, directories give their export files and
+    archives, and anything else is treated as a glob pattern. Duplicates are dropped
+    and the order is kept. Unless quiet, patterns matching nothing are reported.
+    """
+    if isinstance(paths, str):
+        paths = [paths]
+    sources = []
+    for path in paths:
+        if os.path.isdir(path):
+            matches = [os.path.join(path, name) for name in sorted(os.listdir(path))
+                       if is_export_file(name) or is_archive(name)]
+        elif os.path.isfile(path) or ZIP_MEMBER_SEPARATOR in path:
+            matches = [path]
+        else:
+            matches = sorted(glob.glob(path, recursive=True))
+            if not matches and not quiet:
+                print(f"No Files Match {path}")
+        for match in matches:
+            if os.path.isfile(split_source(match)[0]) and match not in sources:
+                sources.append(match)
+    return sources
+
+def expand_inputs(paths):
+    """
+    Expand input paths into a list of export files (see input_sources), with .zip
+    archives replaced by their export members (see archive_members).
+    """
+    filepaths = []
+    for source in input_sources(paths):
+        for filepath in archive_members(source) if is_archive(source) else [source]:
+            if filepath not in filepaths:
+                filepaths.append(filepath)
+    return filepaths
+
+def convert(paths, output_folder="Output", settings=None, workers=None, incremental=False):
+    """
+    Convert the exports given by paths (files, directories, archives or glob patterns, see
+    expand_inputs) into output_folder without prompting, write stats.txt and return the
+    per-file results (see convert_files). settings overrides SETTINGS and workers
+    overrides SETTINGS["workers"] for this call only.
+    """
+    saved = dict(SETTINGS)
+    SETTINGS.update(settings or {})
+    if workers is not None:
+        SETTINGS["workers"] = workers
+    try:
+        results = convert_files(expand_inputs(paths), output_folder, incremental=incremental)
+        write_statistics(statistics_text(results), output_folder)
+    finally:
+        SETTINGS.clear()
+        SETTINGS.update(saved)
+    return results
+
+@contextlib.contextmanager
+def stdout_to_stderr():
+    """Send whatever the with block writes to stdout, from this process or its workers, to stderr."""
+    sys.stdout.flush()
+    saved = os.dup(1)
+    os.dup2(2, 1)
+    try:
+        yield
+    finally:
+        sys.stdout.flush()
+        os.dup2(saved, 1)
+        os.close(saved)
+
+def parse_setting(text):
+    """
+    Parse a KEY=VALUE override; VALUE is read as JSON (2, true, ...) or else kept as a string.
+    filter_* values are checked here, so a bad one fails before any file is converted.
+    """
+    key, sep, value = text.partition("=")
+    if not sep or key not in SETTINGS:
+        raise argparse.ArgumentTypeError(f"expected KEY=VALUE with KEY one of {', '.join(SETTINGS)}")
+    if key in ("filter_since", "filter_until"):
+        # Kept as a string: 2024 is a year here, not a number.
+        return key, None if value in ("", "null") else filter_time_arg(value)
+    try:
+        value = json.loads(value)
+    except ValueError:
+        pass
+    if key in ("filter_authors", "filter_channels"):
+        ids = value if isinstance(value, list) else [value]
+        if not all(isinstance(item, (str, int)) and not isinstance(item, bool) for item in ids):
+            raise argparse.ArgumentTypeError(f"{key} expects an ID or a JSON list of IDs, got {value!r}")
+    elif key in ("filter_has_attachment", "filter_has_embed") and not isinstance(value, bool):
+        raise argparse.ArgumentTypeError(f"{key} expects true or false, got {value!r}")
+    return key, value
+
+def filter_time_arg(value):
+    """argparse type for --since/--until: check the value parses and return it unchanged."""
+    try:
+        parse_filter_time(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected a date or ISO time, got {value!r}")
+    return value
+
+def cli(argv):
+    """Run the non-interactive command line with the given arguments and return the exit code."""
+    arg_parser = argparse.ArgumentParser(
+        prog="bwe_discord_json_parser.py",
+        description="Convert Discord JSON exports to HTML transcripts without prompts. "
+                    "Run without arguments for the interactive mode.")
+    arg_parser.add_argument("inputs", nargs="*", help="export files, directories or glob patterns")
+    arg_parser.add_argument("-o", "--output", default="Output", help="output folder (default: Output)")
+    arg_parser.add_argument("--set", dest="settings", metavar="KEY=VALUE", action="append", default=[],
+                            type=parse_setting, help="override a SETTINGS entry, e.g. --set display_mode=2")
+    arg_parser.add_argument("-w", "--workers", type=int, help="files converted in parallel (0 = one per CPU core)")
+    mode = arg_parser.add_mutually_exclusive_group()
+    mode.add_argument("--update", action="store_true", help="only convert new or changed files")
+    mode.add_argument("--clean", action="store_true", help="delete the output folder before converting")
+    arg_parser.add_argument("--search", metavar="TERM", help="search the output folder (after converting, if inputs are given)")
+    arg_parser.add_argument("--json", action="store_true", help="print the per-file results as JSON")
+    arg_parser.add_argument("--analytics", action="store_true",
+                            help="also write activity analytics (analytics.json, analytics_*.csv, analytics.html)")
+    arg_parser.add_argument("--watch", action="store_true",
+                            help="keep running and convert exports as they are added or changed (implies --update)")
+    arg_parser.add_argument("--profile", choices=("cprofile", "tracemalloc"),
+                            help="profile the run (results in the output folder's profile folder / run_report.json)")
+    filters = arg_parser.add_argument_group("filters", "only convert matching messages (see the filter_* SETTINGS)")
+    filters.add_argument("--since", type=filter_time_arg, help="date or ISO time of the oldest message to keep")
+    filters.add_argument("--until", type=filter_time_arg, help="date (inclusive) or ISO time of the newest message to keep")
+    filters.add_argument("--author", dest="authors", metavar="ID_OR_NAME", action="append", default=[],
+                         help="keep messages by this author id or username (repeatable)")
+    filters.add_argument("--channel", dest="channels", metavar="ID", action="append", default=[],
+                         help="keep messages in this channel id (repeatable)")
+    filters.add_argument("--has-attachment", action="store_true", help="keep messages with attachments only")
+    filters.add_argument("--has-embed", action="store_true", help="keep messages with embeds only")
+    args = arg_parser.parse_args(argv)
+
+    settings = dict(args.settings)
+    if args.profile:
+        settings["profile"] = args.profile
+    if args.analytics:
+        settings["analytics"] = True
+    for key, value in (("filter_since", args.since), ("filter_until", args.until),
+                       ("filter_authors", args.authors), ("filter_channels", args.channels),
+                       ("filter_has_attachment", args.has_attachment), ("filter_has_embed", args.has_embed)):
+        if value:
+            settings[key] = value
+
+    if not args.inputs and args.search is None:
+        arg_parser.error("give input files to convert and/or --search TERM")
+
+    if args.watch:
+        if not args.inputs:
+            arg_parser.error("--watch needs input directories, files or patterns")
+        if args.clean and os.path.exists(args.output):
+            shutil.rmtree(args.output)
+        if hasattr(signal, "SIGTERM"):
+            # Stop between passes like Ctrl+C does when the service is stopped.
+            signal.signal(signal.SIGTERM, signal.default_int_handler)
+        watch(args.inputs, args.output, settings, args.workers)
+        return 0
+
+    if args.inputs:
+        if args.clean and os.path.exists(args.output):
+            shutil.rmtree(args.output)
+        # With --json, stdout carries nothing but the JSON document.
+        with stdout_to_stderr() if args.json else contextlib.nullcontext():
+            results = convert(args.inputs, args.output, settings, args.workers, args.update)
+            if not results:
+                print(Fore.RED + "No JSON Files Found For The Given Inputs." + Style.RESET_ALL)
+                return 1
+        if args.json:
+            summary = [{key: sorted(value, key=str) if isinstance(value, set) else value
+                        for key, value in result.items() if key not in ("part_path", "index_path")}
+                       for result in results]
+            print(json.dumps(summary, indent=1))
+        else:
+            print("\n" + statistics_text(results))
+
+    if args.search is not None:
+        if not print_search_results(args.search, args.output):
+            print("No Matches Found In Output Folder.")
+            return 1
+    return 0
+
+def main():
+    def set_window_title(title):
+        # The console title can only be set on Windows.
+        if os.name != "nt":
+            return
+        # Encode the title to ANSI
+        title_ansi = title.encode('ansi', 'ignore')
+        ctypes.windll.kernel32.SetConsoleTitleA(title_ansi)
+
+    set_window_title('BwE Discord Chat JSON Parser')
+    
+    version = "1.0.0"
+
+    def print_banner():
+        print(Fore.BLACK + Back.CYAN + "*-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-*")
+        print(Fore.BLACK + Back.CYAN + "|" + Fore.WHITE + Back.BLACK + "            __________          __________               " + Fore.BLACK + Back.CYAN + "|")
+        print(Fore.BLACK + Back.CYAN + "|" + Fore.WHITE + Back.BLACK + "            \\______   \\ __  _  _\\_   ____/               " + Fore.BLACK + Back.CYAN + "|")
+        print(Fore.BLACK + Back.CYAN + ":" + Fore.WHITE + Back.BLACK + "             |    |  _//  \\/ \\/  /|   __)_               " + Fore.BLACK + Back.CYAN + ":")
+        print(Fore.BLACK + Back.CYAN + "." + Fore.WHITE + Back.BLACK + "             |    |   \\\\        //        \\              " + Fore.BLACK + Back.CYAN + ".")
+        print(Fore.BLACK + Back.CYAN + ":" + Fore.WHITE + Back.BLACK + "  /\\_/\\      |______  / \\__/\\__//_______  /              " + Fore.BLACK + Back.CYAN + ":")
+        print(Fore.BLACK + Back.CYAN + "|" + Fore.WHITE + Back.BLACK + " ( x.x )            \\/" + Fore.CYAN + " JSON Chat Parser " + Fore.WHITE + "\\/" + version + "          " + Fore.BLACK + Back.CYAN + "|")
+        print(Fore.BLACK + Back.CYAN + "|" + Fore.WHITE + Back.BLACK + " (>   <)                                                 " + Fore.BLACK + Back.CYAN + "|")
+        print(Fore.BLACK + Back.CYAN + "*-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-*" + Back.BLACK + Style.RESET_ALL + "\n")
+
+    print_banner()
+
+    output_folder = "Output"
+    incremental = False
+    # If output folder exists and contains .html files, ask user whether to start over or search.
+    if os.path.exists(output_folder):
+        html_files = [f for f in os.listdir(output_folder) if f.lower().endswith('.html')]
+        if html_files:
+            choice = input(Fore.YELLOW + f"Output Folder '{output_folder}' Already Exists And Contains {len(html_files)} HTML File(s).\n" + Style.RESET_ALL +
+                           "\nDo You Want To (R)escan (Delete Output Folder And Process JSON Files), (U)pdate (Only Process New Or Changed JSON Files)"
+                           " Or (S)earch The Output Folder? [R/U/S]: ").strip().lower()
+            if choice == "s":
+                search_term = input("\nEnter Search Term: ").strip()
+                if print_search_results(search_term, output_folder):
+                    input("\nPress Enter To Quit...")
+                    sys.exit(0)
+                else:
+                    print("No Matches Found In Output Folder.")
+                    input("\nPress Enter To Quit...")
+                    sys.exit(0)
+                return
+            elif choice == "r":
+                # Delete the output folder and its contents.
+                shutil.rmtree(output_folder)
+                os.makedirs(output_folder)
+                print("")
+            elif choice == "u":
+                incremental = True
+                print("")
+            else:
+                input("\nPress Enter To Quit...")
+                sys.exit(0)
+
+    json_files = [f for f in os.listdir('.') if is_export_file(f) or is_archive(f)]
+    filepaths = []
+    for filename in json_files:
+        filepath = os.path.join('.', filename)
+        filepaths.extend(archive_members(filepath) if is_archive(filename) else [filepath])
+    if not filepaths:
+        print(Fore.RED + "No JSON Files Found In The Current Directory." + Style.RESET_ALL)
+        input("\nPress Enter To Quit...")
+        sys.exit(0)
+
+    results = convert_files(filepaths, output_folder, incremental=incremental)
+    stats_text = statistics_text(results)
+
+    # Output statistics to console.
+    print("\n" + stats_text)
+    # Also write statistics to stats.txt inside the output folder.
+    stats_path = write_statistics(stats_text, output_folder)
     print(Fore.GREEN + f"\nStatistics written to {stats_path}" + Style.RESET_ALL)
+    print(Fore.GREEN + f"Run report written to {os.path.join(output_folder, RUN_REPORT_NAME)}" + Style.RESET_ALL)
 
     # Prompt user to search the output folder.
     while True:
         search_choice = input("\nDo You Want To Search The Output Folder For A Term? (Y/N): ").strip().lower()
         if search_choice == "y":
             search_term = input("\nEnter Search Term: ").strip()
-            results = search_output(search_term, output_folder)
-            if results:
-                print("\nSearch Term Found In The Following File(s):")
-                for r in results:
-                    print(f"- {r}")
+            if print_search_results(search_term, output_folder):
                 input("\nPress Enter To Quit...")
-                os._exit(0)
+                sys.exit(0)
             else:
                 print("No Matches Found In Output Folder.")
         elif search_choice == "n":
@@ -508,7 +3498,9 @@ def main():
             print("Please Enter Y Or N.")
 
     input("\nPress Enter To Quit...")
-    os._exit(0)
+    sys.exit(0)
 
 if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        sys.exit(cli(sys.argv[1:]))
     main()
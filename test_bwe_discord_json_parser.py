@@ -0,0 +1,196 @@
+import io
+import os
+import sys
+import json
+import subprocess
+import shutil
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import bwe_discord_json_parser as parser
+
+# Regression checks, run with: python -m unittest test_bwe_discord_json_parser
+
+DAY_MS = 86400000
+START_MS = 1704067200000  # 2024-01-01T00:00:00Z
+
+def make_messages(count, authors=3):
+    """Return count chat messages one day apart, oldest first, with matching snowflake ids."""
+    messages = []
+    for n in range(count):
+        ts_ms = START_MS + n * DAY_MS
+        author = {"id": str(1000 + n % authors), "username": f"user{n % authors}"}
+        messages.append({"id": str((ts_ms - parser.DISCORD_EPOCH_MS) << 22), "type": 0,
+                         "channel_id": "555", "content": f"message {n}",
+                         "timestamp": parser.micros_timestamp(ts_ms * 1000), "author": author,
+                         "mentions": [], "attachments": [], "embeds": []})
+    return messages
+
+class ParserTestCase(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp(prefix="bwe_test_")
+        self.addCleanup(shutil.rmtree, self.folder, ignore_errors=True)
+
+    def write_json(self, name, data):
+        path = os.path.join(self.folder, name)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        return path
+
+class FilterTests(ParserTestCase):
+    def converted_messages(self, data, **settings):
+        path = self.write_json("export.json", data)
+        results = parser.convert([path], os.path.join(self.folder, "Output"), settings=settings)
+        return results[0]["report"]["messages"]
+
+    def test_since_keeps_the_range_in_either_order(self):
+        # Messages from 2024-01-06 on are the last 5 of the 10.
+        messages = make_messages(10)
+        for stream_threshold_mb in (64, 0):
+            for name, data in (("newest first", messages[::-1]), ("oldest first", messages),
+                               ("dm oldest first", {"channels": [{"id": "555"}], "messages": [messages]}),
+                               ("dm newest first", {"channels": [{"id": "555"}], "messages": [messages[::-1]]})):
+                with self.subTest(name, stream_threshold_mb=stream_threshold_mb):
+                    self.assertEqual(self.converted_messages(data, filter_since="2024-01-06",
+                                                             stream_threshold_mb=stream_threshold_mb), 5)
+
+    def test_loaded_list_stops_past_the_range(self):
+        messages = make_messages(10)[::-1]
+        read = []
+        def events():
+            for msg in messages:
+                read.append(msg)
+                yield None, msg
+        parser.SETTINGS["filter_since"] = "2024-01-06"
+        self.addCleanup(parser.SETTINGS.__setitem__, "filter_since", None)
+        out_path = os.path.join(self.folder, "out.html")
+        self.assertEqual(parser.render_export("list", {}, events(), "export.json", out_path), "chat")
+        # The five kept messages, then the first one before the range.
+        self.assertEqual(len(read), 6)
+
+    def test_until_keeps_the_range_in_either_order(self):
+        messages = make_messages(10)
+        for name, data in (("newest first", messages[::-1]), ("oldest first", messages)):
+            with self.subTest(name):
+                self.assertEqual(self.converted_messages(data, filter_until="2024-01-03"), 3)
+
+class ConvertTests(ParserTestCase):
+    def test_missing_input_is_skipped(self):
+        path = self.write_json("export.json", make_messages(3))
+        missing = os.path.join(self.folder, "gone.json")
+        results = parser.convert_files([missing, path], os.path.join(self.folder, "Output"))
+        self.assertEqual([result["file_type"] for result in results], [None, "chat"])
+
+class StreamTests(unittest.TestCase):
+    def test_numbers_split_across_chunks(self):
+        text = '[12.5, 1e3, -7, 0.25E-2, true]'
+        for chunk_size in range(1, len(text) + 1):
+            with self.subTest(chunk_size=chunk_size):
+                stream = parser.JsonStream(io.StringIO(text), chunk_size)
+                self.assertEqual([item.value() for item in stream.array_items()], [12.5, 1e3, -7, 0.25e-2, True])
+
+class CommandLineTests(ParserTestCase):
+    def test_json_output_is_the_only_stdout(self):
+        paths = [self.write_json(name, make_messages(3)) for name in ("a.json", "b.json")]
+        for workers in ("1", "2"):
+            with self.subTest(workers=workers):
+                run = subprocess.run([sys.executable, parser.__file__, *paths, "-o", os.path.join(self.folder, "Output"),
+                                      "--clean", "--json", "-w", workers],
+                                     capture_output=True, text=True, check=True)
+                self.assertEqual([result["file_type"] for result in json.loads(run.stdout)], ["chat", "chat"])
+                self.assertIn("Processed b.json", run.stderr)
+
+    def test_filter_settings_are_checked(self):
+        self.assertEqual(parser.parse_setting("filter_since=2024-01-06"), ("filter_since", "2024-01-06"))
+        self.assertEqual(parser.parse_setting("filter_authors=[\"bob\", 12]"), ("filter_authors", ["bob", 12]))
+        for text in ("filter_since=2024", "filter_until=yesterday", "filter_authors={}", "filter_has_embed=1"):
+            with self.subTest(text):
+                with self.assertRaises(parser.argparse.ArgumentTypeError):
+                    parser.parse_setting(text)
+
+class PagingTests(ParserTestCase):
+    def test_long_page_links_fall_back_to_the_index_link(self):
+        # Every '&' is escaped to five bytes, so three links no longer fit.
+        data = {"messages": [[msg] for msg in make_messages(5)], "total_results": 5}
+        path = self.write_json("&" * 100 + ".json", data)
+        output = os.path.join(self.folder, "Output")
+        results = parser.convert([path], output, settings={"messages_per_page": 2})
+        names = parser.page_names(results[0]["out_name"], 3)
+        with open(os.path.join(output, names[1]), encoding="utf-8") as f:
+            page = f.read()
+        self.assertIn('">Index</a> | Page 2/3</p>', page)
+        self.assertNotIn("Previous", page)
+        self.assertIn("message 2", page)
+
+class MediaHandler(BaseHTTPRequestHandler):
+    """Serves BODY at /full.png, cuts /short.png off after CUT bytes (until asked for the rest) and /chunked.png mid-chunk."""
+
+    protocol_version = "HTTP/1.1"
+    BODY = bytes(range(256)) * 4
+    CUT = 100
+
+    def do_GET(self):
+        body = self.BODY
+        if self.path == "/chunked.png":
+            self.send_response(200)
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            self.wfile.write(b"%x\r\n" % len(body) + body[:self.CUT])
+            self.close_connection = True
+            return
+        requested = self.headers.get("Range")
+        if requested:
+            start = int(requested.split("=")[1].rstrip("-"))
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{len(body) - 1}/{len(body)}")
+            self.send_header("Content-Length", str(len(body) - start))
+            self.end_headers()
+            self.wfile.write(body[start:])
+            return
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.path == "/short.png":
+            self.wfile.write(body[:self.CUT])
+            self.close_connection = True
+        else:
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class MediaTests(ParserTestCase):
+    def setUp(self):
+        super().setUp()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), MediaHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.base = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.media_folder = os.path.join(self.folder, parser.MEDIA_FOLDER)
+        os.makedirs(self.media_folder)
+
+    def stored(self, name):
+        with open(os.path.join(self.media_folder, name), "rb") as f:
+            return f.read()
+
+    def test_complete_download(self):
+        name = parser.download_media(f"{self.base}/full.png", self.media_folder)
+        self.assertEqual(self.stored(name), MediaHandler.BODY)
+
+    def test_truncated_download_is_resumed(self):
+        url = f"{self.base}/short.png"
+        self.assertIsNone(parser.download_media(url, self.media_folder))
+        # The next attempt asks only for the missing bytes.
+        name = parser.download_media(url, self.media_folder)
+        self.assertEqual(self.stored(name), MediaHandler.BODY)
+
+    def test_truncated_chunked_download_does_not_stop_the_others(self):
+        urls = [f"{self.base}/chunked.png", f"{self.base}/full.png"]
+        saved = parser.asyncio.run(parser.fetch_media(urls, self.media_folder, 2))
+        self.assertEqual(list(saved), [f"{self.base}/full.png"])
+
+if __name__ == "__main__":
+    unittest.main()